@@ -0,0 +1,224 @@
+from contextlib import contextmanager
+import fcntl
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+class VideoArtifacts:
+    def __init__(self, store, video_id):
+        self.store = store
+        self.video_id = video_id
+        self.loaded = {}
+
+    def _load(self, name, loader):
+        # read from disk on first access only
+        if name not in self.loaded:
+            self.loaded[name] = loader()
+        return self.loaded[name]
+
+    @property
+    def transcript(self):
+        return self._load(
+            "transcript", lambda: self.store.read_json(self.video_id, "transcript.json")
+        )
+
+    @property
+    def chunks(self):
+        return self._load(
+            "chunks", lambda: self.store.read_json(self.video_id, "chunks.json")
+        )
+
+    @property
+    def timestamps(self):
+        return self._load(
+            "timestamps", lambda: self.store.read_json(self.video_id, "timestamps.json")
+        )
+
+    @property
+    def summary(self):
+        return self._load(
+            "summary", lambda: self.store.read_text(self.video_id, "summary.txt")
+        )
+
+    @property
+    def audio(self):
+        return self._load("audio", lambda: self.store.read_audio(self.video_id))
+
+    @property
+    def audio_format(self):
+        return self.store.audio_format(self.video_id)
+
+
+class ArtifactStore:
+    def __init__(self, path="/DataBases/artifacts", max_bytes=2 * 1024**3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def video_dir(self, video_id):
+        return os.path.join(self.path, video_id)
+
+    def get(self, video_id):
+        if not os.path.isdir(self.video_dir(video_id)):
+            return None
+        self.touch(video_id)
+        return VideoArtifacts(self, video_id)
+
+    def save(
+        self,
+        video_id,
+        transcript=None,
+        chunks=None,
+        timestamps=None,
+        summary=None,
+        audio=None,
+        audio_format="wav",
+    ):
+        with self.lock, self.file_lock():
+            os.makedirs(self.video_dir(video_id), exist_ok=True)
+            if transcript is not None:
+                self.write(
+                    video_id, "transcript.json", json.dumps(list(transcript)).encode()
+                )
+            if chunks is not None:
+                self.write(video_id, "chunks.json", json.dumps(list(chunks)).encode())
+            if timestamps is not None:
+                self.write(
+                    video_id, "timestamps.json", json.dumps(list(timestamps)).encode()
+                )
+            if summary is not None:
+                self.write(video_id, "summary.txt", summary.encode("utf-8"))
+            if audio is not None:
+                # the new audio is in place before the old one goes, readers
+                # always find one
+                self.write(video_id, f"audio.{audio_format}", audio)
+                for old_audio in self.audio_paths(video_id)[1:]:
+                    self.remove(old_audio)
+
+            self.touch(video_id)
+            self.evict(keep=video_id)
+
+    @contextmanager
+    def file_lock(self):
+        # saves and evictions of every process sharing the store, one at a time
+        with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def video_lock(self, video_id):
+        # one process at a time producing an artifact of this video; kept
+        # beside the video directories, eviction removes those
+        with open(os.path.join(self.path, f".{video_id}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write(self, video_id, filename, data):
+        # write to a temp file and rename, so readers never see half a file
+        with tempfile.NamedTemporaryFile(
+            dir=self.video_dir(video_id), delete=False
+        ) as temp_file:
+            temp_file.write(data)
+        os.replace(temp_file.name, os.path.join(self.video_dir(video_id), filename))
+
+    def read_bytes(self, video_id, filename):
+        try:
+            with open(os.path.join(self.video_dir(video_id), filename), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def read_json(self, video_id, filename):
+        data = self.read_bytes(video_id, filename)
+        return json.loads(data) if data is not None else None
+
+    def read_text(self, video_id, filename):
+        data = self.read_bytes(video_id, filename)
+        return data.decode("utf-8") if data is not None else None
+
+    def audio_paths(self, video_id):
+        # newest first
+        paths = []
+        for path in glob.glob(os.path.join(self.video_dir(video_id), "audio.*")):
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def audio_format(self, video_id):
+        audio_paths = self.audio_paths(video_id)
+        return audio_paths[0].rsplit(".", 1)[-1] if audio_paths else None
+
+    def read_audio(self, video_id):
+        audio_format = self.audio_format(video_id)
+        return (
+            self.read_bytes(video_id, f"audio.{audio_format}") if audio_format else None
+        )
+
+    def touch(self, video_id):
+        # the directory mtime is the last access time for LRU eviction
+        try:
+            os.utime(self.video_dir(video_id), (time.time(), time.time()))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def dir_size(self, video_id):
+        # readers may delete files or the directory as it is being sized
+        size = 0
+        try:
+            for entry in os.scandir(self.video_dir(video_id)):
+                try:
+                    if entry.is_file():
+                        size += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        except FileNotFoundError:
+            pass
+        return size
+
+    def video_ids(self):
+        # least recently used first
+        video_ids = []
+        for entry in os.scandir(self.path):
+            try:
+                if entry.is_dir():
+                    video_ids.append((entry.stat().st_mtime, entry.name))
+            except FileNotFoundError:
+                pass
+        return [video_id for _, video_id in sorted(video_ids)]
+
+    def size(self):
+        return sum(self.dir_size(video_id) for video_id in self.video_ids())
+
+    def evict(self, keep=None):
+        # callers hold file_lock
+        video_ids = self.video_ids()
+        total_size = sum(self.dir_size(video_id) for video_id in video_ids)
+
+        for video_id in video_ids:
+            if total_size <= self.max_bytes:
+                break
+            if video_id == keep:
+                continue
+            total_size -= self.dir_size(video_id)
+            shutil.rmtree(self.video_dir(video_id), ignore_errors=True)
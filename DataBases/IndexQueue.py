@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from DataBases.VectorStore import delete_chunks_from, upsert_chunks
+from utils.Metrics import METRICS
+
+
+class IndexQueue:
+    # embedded chunk batches from the worker processes, waiting for the one
+    # process that owns the chroma db to write them; chroma's persistent client
+    # is not safe to open from several processes at once. a batch with no
+    # documents marks the end of a video, chunks past its count are deleted
+    def __init__(self, path="/DataBases/index_queue.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, video_id TEXT, "
+            "start_index INTEGER, chunk_count INTEGER, documents TEXT, "
+            "timestamps TEXT, embeddings BLOB, dimensions INTEGER, "
+            "status TEXT DEFAULT 'queued', error TEXT, created_at REAL)"
+        )
+
+    def insert(self, **fields):
+        fields["created_at"] = time.time()
+        with self.lock:
+            return self.db.execute(
+                f"INSERT INTO batches ({', '.join(fields)}) "
+                f"VALUES ({', '.join('?' * len(fields))})",
+                tuple(fields.values()),
+            ).lastrowid
+
+    def push(self, video_id, start_index, documents, timestamps, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return self.insert(
+            video_id=video_id,
+            start_index=start_index,
+            chunk_count=len(documents),
+            documents=json.dumps(documents),
+            timestamps=json.dumps(timestamps),
+            embeddings=embeddings.tobytes(),
+            dimensions=embeddings.shape[1] if embeddings.ndim == 2 else 0,
+        )
+
+    def push_end(self, video_id, chunk_count):
+        return self.insert(video_id=video_id, chunk_count=chunk_count)
+
+    def pop(self, limit=16):
+        # oldest first, a video's end marker is written after its batches
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM batches WHERE status = 'queued' ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+        batches = []
+        for row in rows:
+            batch = dict(row)
+            if batch["documents"] is not None:
+                batch["documents"] = json.loads(batch["documents"])
+                batch["timestamps"] = json.loads(batch["timestamps"])
+                batch["embeddings"] = np.frombuffer(
+                    batch["embeddings"], dtype=np.float32
+                ).reshape(batch["chunk_count"], batch["dimensions"])
+            batches.append(batch)
+        return batches
+
+    def ack(self, batch_id, error=None):
+        # a written batch is deleted, a failed one kept for its waiter
+        with self.lock:
+            if error is None:
+                self.db.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+            else:
+                self.db.execute(
+                    "UPDATE batches SET status = 'failed', error = ? WHERE id = ?",
+                    (str(error), batch_id),
+                )
+
+    def wait(self, batch_id, timeout=None, poll_interval=0.05):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT status, error FROM batches WHERE id = ?", (batch_id,)
+                ).fetchone()
+            if row is None:
+                return
+            if row["status"] == "failed":
+                with self.lock:
+                    self.db.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+                raise RuntimeError(f"Writing to the vector db failed: {row['error']}")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("No process is writing to the vector db")
+            time.sleep(poll_interval)
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT status, COUNT(*) AS count FROM batches GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+class IndexWriter:
+    # drains the index queue in the process that owns the chroma db and keeps
+    # that process's retrieval indexes up to date with what it writes
+    def __init__(self, index_queue, collection, vector_stores, poll_interval=0.1):
+        self.index_queue = index_queue
+        self.collection = collection
+        # a callable, vector stores are created per api key after the writer
+        self.vector_stores = vector_stores
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.thread.join(timeout)
+
+    def run(self):
+        while not self.stopped.is_set():
+            batches = self.index_queue.pop()
+            if not batches:
+                self.stopped.wait(self.poll_interval)
+                continue
+            for batch in batches:
+                try:
+                    self.write(batch)
+                except Exception as error:
+                    METRICS.count("index_write_errors")
+                    self.index_queue.ack(batch["id"], error)
+                else:
+                    self.index_queue.ack(batch["id"])
+
+    def write(self, batch):
+        video_id = batch["video_id"]
+        if batch["documents"] is None:
+            if delete_chunks_from(self.collection, video_id, batch["chunk_count"]):
+                for vector_store in self.vector_stores():
+                    vector_store.forget(video_id)
+            return
+
+        upsert_chunks(
+            self.collection,
+            batch["documents"],
+            batch["timestamps"],
+            batch["embeddings"],
+            video_id,
+            batch["start_index"],
+        )
+        # the batch is written, a cached index that can't take it (one loaded
+        # while the batch before was being written) is dropped and reloaded
+        for vector_store in self.vector_stores():
+            try:
+                vector_store.update_indexes(
+                    batch["documents"],
+                    batch["timestamps"],
+                    batch["embeddings"],
+                    video_id,
+                    batch["start_index"],
+                )
+            except Exception:
+                METRICS.count("index_refresh_errors")
+                vector_store.forget(video_id)
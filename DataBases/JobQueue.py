@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ACTIVE = ("queued", "running")
+
+
+class JobQueue:
+    def __init__(self, path="/DataBases/jobs.sqlite", stale_after=15 * 60):
+        self.path = path
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # autocommit, transactions are explicit
+        self.db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, video_id TEXT, owner TEXT, "
+            "status TEXT, ready INTEGER DEFAULT 0, messages TEXT DEFAULT '[]', "
+            "result TEXT, error TEXT, worker TEXT, attempts INTEGER DEFAULT 0, "
+            "created_at REAL, started_at REAL, updated_at REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, owner, id)"
+        )
+
+    def transaction(self, function):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = function()
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return result
+
+    def enqueue(self, video_id, owner):
+        # a video that is already queued or running is not queued twice,
+        # every caller gets the id of the job that will ingest it; other owners
+        # queue their own job, the manifest keeps them from ingesting it twice
+        def enqueue():
+            row = self.db.execute(
+                "SELECT id FROM jobs WHERE video_id = ? AND owner = ? "
+                "AND status IN (?, ?) ORDER BY id LIMIT 1",
+                (video_id, owner, *ACTIVE),
+            ).fetchone()
+            if row:
+                return row["id"]
+
+            now = time.time()
+            return self.db.execute(
+                "INSERT INTO jobs (video_id, owner, status, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?)",
+                (video_id, owner, now, now),
+            ).lastrowid
+
+        return self.transaction(enqueue)
+
+    def claim(self, owner, worker):
+        # oldest queued job first; a running job whose worker stopped
+        # heartbeating is handed to the next worker
+        def claim():
+            now = time.time()
+            row = self.db.execute(
+                "SELECT id FROM jobs WHERE owner = ? AND (status = 'queued' "
+                "OR (status = 'running' AND updated_at < ?)) ORDER BY id LIMIT 1",
+                (owner, now - self.stale_after),
+            ).fetchone()
+            if row is None:
+                return None
+
+            self.db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, "
+                "attempts = attempts + 1, started_at = ?, updated_at = ? WHERE id = ?",
+                (worker, now, now, row["id"]),
+            )
+            return row["id"]
+
+        job_id = self.transaction(claim)
+        return None if job_id is None else self.get(job_id)
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["messages"] = json.loads(job["messages"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def report(self, job_id, message):
+        # also works as a heartbeat for the worker holding the job
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET messages = json_insert(messages, '$[#]', ?), "
+                "updated_at = ? WHERE id = ?",
+                (message, time.time(), job_id),
+            )
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self.lock:
+            self.db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def mark_ready(self, job_id):
+        self.update(job_id, ready=1)
+
+    def finish(self, job_id, result=None):
+        self.update(job_id, status="done", ready=1, result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        self.update(job_id, status="failed", error=str(error))
+
+    def pending(self, job_ids):
+        job_ids = list(job_ids)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT id FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))}) "
+                "AND status IN (?, ?)",
+                (*job_ids, *ACTIVE),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
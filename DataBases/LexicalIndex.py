@@ -0,0 +1,99 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.checked_at = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        self.ids = []
+        self.documents = []
+        self.timestamps = []
+        self.postings = defaultdict(list)
+        self.lengths = []
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, ids, documents, timestamps, start_index=None):
+        with self.lock:
+            if start_index is None:
+                start_index = len(self.documents)
+            if start_index < len(self.documents):
+                # a re-ingested video overwrites its chunks, rebuild from scratch
+                ids = self.ids[:start_index] + list(ids)
+                documents = self.documents[:start_index] + list(documents)
+                timestamps = self.timestamps[:start_index] + list(timestamps)
+                self.reset()
+                start_index = 0
+            elif start_index > len(self.documents):
+                raise ValueError(
+                    f"Chunk {start_index} added before chunk {len(self.documents)}"
+                )
+
+            for index, document in enumerate(documents, start_index):
+                tokens = tokenize(document)
+                for token, count in Counter(tokens).items():
+                    self.postings[token].append((index, count))
+                self.lengths.append(len(tokens))
+            self.ids.extend(ids)
+            self.documents.extend(documents)
+            self.timestamps.extend(timestamps)
+
+    def search(self, query, n_results=5):
+        # returns (id, document, timestamp, score) tuples, best first;
+        # chunks without any of the query terms are left out
+        with self.lock:
+            return self._search(query, n_results)
+
+    def _search(self, query, n_results):
+        if not self.documents:
+            return []
+
+        lengths = np.asarray(self.lengths, dtype=np.float32)
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / lengths.mean())
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            indexes, counts = np.asarray(postings, dtype=np.float32).T
+            indexes = indexes.astype(np.int64)
+            idf = np.log(
+                1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            scores[indexes] += (
+                idf * counts * (self.k1 + 1) / (counts + length_norm[indexes])
+            )
+
+        matched = np.flatnonzero(scores)
+        top = matched[np.argsort(-scores[matched], kind="stable")[:n_results]]
+        return [
+            (self.ids[index], self.documents[index], self.timestamps[index], score)
+            for index, score in zip(top.tolist(), scores[top].tolist())
+        ]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    # each ranking is a list of chunk ids, best first
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] += 1 / (k + rank + 1)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import numpy as np
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorIndex:
+    # one video's chunk embeddings as a contiguous float32 matrix of unit rows
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = time.monotonic()
+        self.ids = []
+        self.documents = []
+        self.timestamps = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, ids, documents, timestamps, embeddings, start_index=None):
+        embeddings = normalize(np.asarray(embeddings, dtype=np.float32))
+        with self.lock:
+            if start_index is None:
+                start_index = len(self.documents)
+            if start_index > len(self.documents):
+                raise ValueError(
+                    f"Chunk {start_index} added before chunk {len(self.documents)}"
+                )
+            # a re-ingested video overwrites its chunks from start_index on
+            del self.ids[start_index:]
+            del self.documents[start_index:]
+            del self.timestamps[start_index:]
+            matrix = self.matrix[:start_index] if start_index else embeddings[:0]
+
+            self.matrix = np.ascontiguousarray(np.concatenate([matrix, embeddings]))
+            self.ids.extend(ids)
+            self.documents.extend(documents)
+            self.timestamps.extend(timestamps)
+
+    def search(self, query_embedding, n_results=5):
+        # returns (id, document, timestamp, score) tuples, best first
+        query = normalize(np.asarray(query_embedding, dtype=np.float32))
+        with self.lock:
+            if not self.documents:
+                return []
+
+            scores = self.matrix @ query
+            if n_results < len(scores):
+                top = np.argpartition(-scores, n_results - 1)[:n_results]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [
+                (self.ids[index], self.documents[index], self.timestamps[index], score)
+                for index, score in zip(top.tolist(), scores[top].tolist())
+            ]
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class IngestionManifest:
+    def __init__(self, path="/DataBases/manifest.sqlite", stale_after=15 * 60):
+        self.path = path
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # autocommit, transactions are explicit
+        self.db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            "video_id TEXT PRIMARY KEY, status TEXT, chunk_count INTEGER, "
+            "transcript_source TEXT, embedding_model TEXT, error TEXT, "
+            "created_at REAL, updated_at REAL)"
+        )
+
+    def get(self, video_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM videos WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def try_begin(self, video_id, embedding_model=None):
+        # claims the video for ingestion; only one caller across sessions and
+        # processes wins, unless the previous attempt failed or went stale
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self.db.execute(
+                    "INSERT INTO videos VALUES (?, 'in_progress', 0, NULL, ?, NULL, ?, ?) "
+                    "ON CONFLICT(video_id) DO UPDATE SET "
+                    "status = 'in_progress', chunk_count = 0, transcript_source = NULL, "
+                    "embedding_model = excluded.embedding_model, error = NULL, "
+                    "updated_at = excluded.updated_at "
+                    "WHERE status = 'failed' "
+                    "OR (status = 'in_progress' AND updated_at < ?)",
+                    (video_id, embedding_model, now, now, now - self.stale_after),
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def update(self, video_id, **fields):
+        # also works as a heartbeat, so long ingestions don't look stale
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self.lock:
+            self.db.execute(
+                f"UPDATE videos SET {assignments} WHERE video_id = ?",
+                (*fields.values(), video_id),
+            )
+
+    def mark_ready(self, video_id, chunk_count, **fields):
+        self.update(video_id, status="ready", chunk_count=chunk_count, **fields)
+
+    def mark_failed(self, video_id, error):
+        self.update(video_id, status="failed", error=str(error))
+
+    def backfill(self, video_id, chunk_count, embedding_model=None):
+        # videos indexed before the manifest existed
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO videos VALUES (?, 'ready', ?, NULL, ?, NULL, ?, ?)",
+                (video_id, chunk_count, embedding_model, now, now),
+            )
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+class TranscriptCache:
+    # raw caption transcripts, one .npz per video: the utf-8 texts packed into
+    # one byte array with their offsets, float32 starts and durations. a video
+    # whose captions can't be had is remembered with the reason for failure_ttl
+    # seconds. file mtimes are last access times for LRU eviction
+    def __init__(
+        self,
+        path="/DataBases/transcripts",
+        max_bytes=256 * 1024**2,
+        failure_ttl=7 * 24 * 3600,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.failure_ttl = failure_ttl
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def file_path(self, video_id, extension):
+        return os.path.join(self.path, f"{video_id}.{extension}")
+
+    def get(self, video_id):
+        # (transcript list, language code, kind) or None
+        path = self.file_path(video_id, "npz")
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                text = data["text"].tobytes()
+                offsets = data["offsets"].tolist()
+                starts = data["starts"].astype(np.float64).round(3).tolist()
+                durations = data["durations"].astype(np.float64).round(3).tolist()
+                language_code, kind = str(data["language_code"]), str(data["kind"])
+        except FileNotFoundError:
+            return None
+        self.touch(path)
+        transcript_list = [
+            {
+                "text": text[offsets[i] : offsets[i + 1]].decode("utf-8"),
+                "start": starts[i],
+                "duration": durations[i],
+            }
+            for i in range(len(starts))
+        ]
+        return transcript_list, language_code, kind
+
+    def set(self, video_id, transcript_list, language_code, kind):
+        texts = [item["text"].encode("utf-8") for item in transcript_list]
+        columns = {
+            "text": np.frombuffer(b"".join(texts), dtype=np.uint8),
+            "offsets": np.cumsum([0] + [len(text) for text in texts], dtype=np.int64),
+            "starts": np.array(
+                [item["start"] for item in transcript_list], dtype=np.float32
+            ),
+            "durations": np.array(
+                [item.get("duration", 0.0) for item in transcript_list],
+                dtype=np.float32,
+            ),
+            "language_code": np.array(language_code),
+            "kind": np.array(kind),
+        }
+        with self.lock:
+            # write to a temp file and rename, so readers never see half a file
+            with tempfile.NamedTemporaryFile(
+                dir=self.path, suffix=".tmp", delete=False
+            ) as temp_file:
+                np.savez(temp_file, **columns)
+            os.replace(temp_file.name, self.file_path(video_id, "npz"))
+            self.remove(self.file_path(video_id, "failed"))
+            self.evict(keep=video_id)
+
+    def failure(self, video_id):
+        # the reason captions were unavailable, while it is still trusted
+        path = self.file_path(video_id, "failed")
+        try:
+            if os.path.getmtime(path) + self.failure_ttl < time.time():
+                return None
+            with open(path) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def set_failure(self, video_id, reason):
+        with self.lock:
+            with open(self.file_path(video_id, "failed"), "w") as file:
+                file.write(reason)
+
+    @staticmethod
+    def touch(path):
+        try:
+            os.utime(path, (time.time(), time.time()))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep=None):
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.path)
+            if entry.name.endswith(".npz")
+        )
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            if path == self.file_path(keep, "npz"):
+                continue
+            self.remove(path)
+            total_size -= size
@@ -1,67 +1,568 @@
+import asyncio
 import chromadb
+import numpy as np
 import sys
 import os
-import uuid
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(parent_dir)
 
 from utils.LLM import GeminiLLM
+from utils.RateLimiter import INTERACTIVE
+from utils.Metrics import METRICS
+from DataBases.LexicalIndex import BM25Index, reciprocal_rank_fusion
+from DataBases.LocalVectorIndex import LocalVectorIndex
+
+
+COLLECTION_NAME = "yt_transcripts"
+
+
+def upsert_chunks(collection, documents, timestamps, embeddings, video_id, start_index):
+    # ids are deterministic, so re-ingesting a video overwrites it
+    collection.upsert(
+        ids=[f"{video_id}-{start_index + j}" for j in range(len(documents))],
+        documents=documents,
+        embeddings=embeddings,
+        metadatas=[
+            {
+                "start": t,
+                "youtube_id": video_id,
+            }
+            for t in timestamps
+        ],
+    )
+
+
+def delete_chunks_from(collection, video_id, chunk_count):
+    # deletes a video's chunks from chunk_count on, returns how many there were
+    stored_ids = collection.get(where={"youtube_id": video_id}, include=[])["ids"]
+    stale_ids = [
+        chunk_id
+        for chunk_id in stored_ids
+        if int(chunk_id.rsplit("-", 1)[1]) >= chunk_count
+    ]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    return len(stale_ids)
 
 
 class VectorStore:
-    def __init__(self, api_key):
-        self.chroma_client = chromadb.PersistentClient(path="/DataBases/my_chroma_db")
+    def __init__(
+        self,
+        api_key,
+        cache=None,
+        embedding_cache=None,
+        path="/DataBases/my_chroma_db",
+        embedding_function=None,
+        chroma_client=None,
+        batch_size=100,
+        max_workers=4,
+        vector_timeout=3.0,
+        vector_cooldown=30.0,
+        max_lexical_videos=256,
+        local_index=False,
+        max_local_videos=64,
+        refresh_interval=5.0,
+        index_queue=None,
+        write_timeout=600.0,
+    ):
+        self.embedding_function = embedding_function or GeminiLLM(
+            api_key, cache, embedding_cache
+        )
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+        # per video bm25 indexes and, with local_index, per video embedding
+        # matrices; least recently queried evicted first
+        self.lexical_indexes = OrderedDict()
+        self.max_lexical_videos = max_lexical_videos
+        self.local_index = local_index
+        self.vector_indexes = OrderedDict()
+        self.max_local_videos = max_local_videos
+        self.loading = set()
+        self.index_lock = threading.Lock()
+        self.refresh_interval = refresh_interval
+
+        # embedding queries slower than vector_timeout, or failing, switch
+        # retrieval to the lexical index alone for vector_cooldown seconds
+        self.vector_timeout = vector_timeout
+        self.vector_cooldown = vector_cooldown
+        self.vector_unavailable_until = 0.0
+        self.query_executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+        # with an index queue, batches are handed to the process that owns the
+        # chroma db and this store only embeds, it has no collection to query
+        self.index_queue = index_queue
+        self.write_timeout = write_timeout
+        if index_queue is not None:
+            self.chroma_client = self.collection = None
+            return
+        self.chroma_client = chroma_client or chromadb.PersistentClient(path=path)
         self.collection = self.chroma_client.get_or_create_collection(
-            "yt_transcripts", embedding_function=GeminiLLM(api_key)
+            COLLECTION_NAME, embedding_function=self.embedding_function
         )
 
-    def add_documents(self, documents, timestamps, video_id):
-        self.documents = documents
-        self.timestamps = timestamps
-        self.video_id = video_id
+    def embed_batch(self, documents):
+        # identical chunks (intros, jingles, repeated phrases) are embedded once
+        unique_documents = list(dict.fromkeys(documents))
+        with METRICS.span("embed_batch"):
+            embeddings = dict(
+                zip(unique_documents, self.embedding_function(unique_documents))
+            )
+        return [embeddings[document] for document in documents]
 
-        self.chunks_len = len(self.documents)
-        for i in range(0, self.chunks_len, 100):
-
-            self.collection.add(
-                documents=self.documents[i : i + 100],
-                ids=[
-                    str(uuid.uuid4())
-                    for _ in range(
-                        100 if self.chunks_len >= 100 else self.chunks_len % 100
-                    )
-                ],
-                metadatas=[
-                    {
-                        "start": t,
-                        "youtube_id": self.video_id,
-                    }
-                    for t in self.timestamps[i : i + 100]
-                ],
+    def add_documents(self, documents, timestamps, video_id, start_index=0):
+        with METRICS.span("vector_store_add"):
+            self._add_documents(documents, timestamps, video_id, start_index)
+        METRICS.count("chunks_indexed", len(documents))
+
+    def _add_documents(self, documents, timestamps, video_id, start_index):
+        batch_starts = range(0, len(documents), self.batch_size)
+
+        # embedding requests run concurrently, writes stay in batch order
+        all_embeddings = []
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_workers, len(batch_starts)))
+        ) as executor:
+            batch_embeddings = executor.map(
+                self.embed_batch,
+                [documents[i : i + self.batch_size] for i in batch_starts],
             )
-            self.chunks_len -= 100
 
-    def retrieve_documents(self, query, video_id, n_results=5):
-        self.query = query
-        self.n_results = n_results
-        self.video_id = video_id
+            for i, embeddings in zip(batch_starts, batch_embeddings):
+                if self.local_index:
+                    all_embeddings.extend(embeddings)
+                self.store_batch(
+                    documents[i : i + self.batch_size],
+                    timestamps[i : i + self.batch_size],
+                    embeddings,
+                    video_id,
+                    start_index + i,
+                )
+
+        self.update_indexes(
+            documents, timestamps, all_embeddings, video_id, start_index
+        )
+
+    def store_batch(self, documents, timestamps, embeddings, video_id, start_index):
+        if self.index_queue is None:
+            upsert_chunks(
+                self.collection,
+                documents,
+                timestamps,
+                embeddings,
+                video_id,
+                start_index,
+            )
+            return
+        # a batch counts as stored once the owning process has written it
+        batch_id = self.index_queue.push(
+            video_id, start_index, documents, timestamps, embeddings
+        )
+        self.index_queue.wait(batch_id, self.write_timeout)
+
+    def delete_from(self, video_id, chunk_count):
+        # a re-ingested video with fewer chunks than before keeps the old ones
+        # past its new end, unless they are deleted once it is fully indexed
+        if self.index_queue is not None:
+            self.index_queue.wait(
+                self.index_queue.push_end(video_id, chunk_count), self.write_timeout
+            )
+            return
+        deleted = delete_chunks_from(self.collection, video_id, chunk_count)
+        if deleted:
+            self.forget(video_id)
+        return deleted
+
+    def forget(self, video_id):
+        # cached indexes may hold deleted chunks, the next query reloads them
+        with self.index_lock:
+            self.lexical_indexes.pop(video_id, None)
+            self.vector_indexes.pop(video_id, None)
+
+    def update_indexes(self, documents, timestamps, embeddings, video_id, start_index):
+        # videos indexed from their first chunk get their bm25 index built here,
+        # anything else is loaded from the collection on the first query; a
+        # queued store has nothing to query, the owning process updates its own
+        if self.index_queue is not None:
+            return
+        ids = [f"{video_id}-{start_index + i}" for i in range(len(documents))]
+        with self.index_lock:
+            lexical_index = self.lexical_indexes.get(video_id)
+            if lexical_index is None and start_index == 0:
+                lexical_index = self.cache_index(
+                    self.lexical_indexes, self.max_lexical_videos, video_id, BM25Index()
+                )
+            vector_index = self.vector_indexes.get(video_id)
+            if vector_index is None and start_index == 0 and self.local_index:
+                vector_index = self.cache_index(
+                    self.vector_indexes,
+                    self.max_local_videos,
+                    video_id,
+                    LocalVectorIndex(),
+                )
+        if lexical_index is not None:
+            lexical_index.add(ids, documents, timestamps, start_index)
+        if vector_index is not None and documents:
+            vector_index.add(ids, documents, timestamps, embeddings, start_index)
+
+    def cache_index(self, indexes, max_videos, video_id, index):
+        indexes[video_id] = index
+        indexes.move_to_end(video_id)
+        while len(indexes) > max_videos:
+            indexes.popitem(last=False)
+        return index
+
+    def cached_index(self, indexes, video_id):
+        with self.index_lock:
+            index = indexes.get(video_id)
+            if index is not None:
+                indexes.move_to_end(video_id)
+        return index
+
+    def is_stale(self, video_id, index):
+        # worker processes keep adding chunks, look for the next one at most
+        # once per refresh_interval
+        now = time.monotonic()
+        if now - index.checked_at < self.refresh_interval:
+            return False
+        index.checked_at = now
+        next_id = f"{video_id}-{len(index)}"
+        return bool(self.collection.get(ids=[next_id], include=[])["ids"])
+
+    def lexical_index(self, video_id):
+        lexical_index = self.cached_index(self.lexical_indexes, video_id)
+        if lexical_index is not None and not self.is_stale(video_id, lexical_index):
+            return lexical_index
+
+        stored = self.collection.get(
+            where={"youtube_id": video_id}, include=["documents", "metadatas"]
+        )
+        chunks = sorted(
+            zip(stored["metadatas"], stored["ids"], stored["documents"]),
+            key=lambda chunk: chunk[0]["start"],
+        )
+        lexical_index = BM25Index()
+        lexical_index.add(
+            [chunk_id for _, chunk_id, _ in chunks],
+            [document for _, _, document in chunks],
+            [metadata["start"] for metadata, _, _ in chunks],
+        )
+        with self.index_lock:
+            return self.cache_index(
+                self.lexical_indexes, self.max_lexical_videos, video_id, lexical_index
+            )
+
+    def local_vector_index(self, video_id):
+        vector_index = self.cached_index(self.vector_indexes, video_id)
+        if vector_index is not None and not self.is_stale(video_id, vector_index):
+            return vector_index
+
+        # this query goes to chroma, the matrix is loaded for the next ones
+        with self.index_lock:
+            if video_id not in self.loading:
+                self.loading.add(video_id)
+                self.query_executor.submit(self.load_vector_index, video_id)
+        return None
+
+    def load_vector_index(self, video_id):
+        try:
+            stored = self.collection.get(
+                where={"youtube_id": video_id},
+                include=["documents", "metadatas", "embeddings"],
+            )
+            order = np.argsort(
+                [metadata["start"] for metadata in stored["metadatas"]], kind="stable"
+            )
+            vector_index = LocalVectorIndex()
+            if len(order):
+                vector_index.add(
+                    [stored["ids"][i] for i in order],
+                    [stored["documents"][i] for i in order],
+                    [stored["metadatas"][i]["start"] for i in order],
+                    np.asarray(stored["embeddings"], dtype=np.float32)[order],
+                )
+            with self.index_lock:
+                self.cache_index(
+                    self.vector_indexes, self.max_local_videos, video_id, vector_index
+                )
+        finally:
+            with self.index_lock:
+                self.loading.discard(video_id)
+
+    def lexical_search(self, query, video_id, n_results):
+        return {
+            chunk_id: {"text": text, "start": int(start)}
+            for chunk_id, text, start, _ in self.lexical_index(video_id).search(
+                query, n_results
+            )
+        }
 
-        self.results = self.collection.query(
-            query_texts=self.query,
-            n_results=self.n_results,
-            where={"youtube_id": self.video_id},
+    def vector_search(self, query, video_id, n_results):
+        vector_index = self.local_vector_index(video_id) if self.local_index else None
+        if vector_index is not None:
+            query_embedding = self.embedding_function.embed_query([query])[0]
+            return self.local_search(vector_index, query_embedding, n_results)
+        return self.collection_search(video_id, n_results, query_texts=query)
+
+    @staticmethod
+    def local_search(vector_index, query_embedding, n_results):
+        return {
+            chunk_id: {"text": text, "start": int(start)}
+            for chunk_id, text, start, _ in vector_index.search(
+                query_embedding, n_results
+            )
+        }
+
+    def collection_search(self, video_id, n_results, **query):
+        # query is query_texts, embedded by the collection, or query_embeddings
+        results = self.collection.query(
+            **query,
+            n_results=n_results,
+            where={"youtube_id": video_id},
             include=["documents", "metadatas"],
         )
+        return {
+            chunk_id: {"text": text, "start": int(metadata["start"])}
+            for chunk_id, text, metadata in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0]
+            )
+        }
+
+    def retrieve_documents(self, query, video_id, n_results=5, mode="hybrid"):
+        with METRICS.span("retrieve", mode=mode):
+            return self._retrieve_documents(query, video_id, n_results, mode)
+
+    def _retrieve_documents(self, query, video_id, n_results, mode):
+        # mode is "hybrid", "vector" or "lexical"
+        if mode == "vector":
+            return list(self.vector_search(query, video_id, n_results).values())
+
+        # each side brings more candidates than needed, fusion picks the top
+        candidates = max(4 * n_results, 20)
+        vector_future = None
+        if mode == "hybrid" and self.vector_available():
+            vector_future = self.query_executor.submit(
+                self.vector_search, query, video_id, candidates
+            )
+
+        chunks = self.lexical_search(query, video_id, candidates)
+        rankings = [list(chunks)]
+
+        if vector_future is not None:
+            try:
+                vector_chunks = vector_future.result(timeout=self.vector_timeout)
+            except Exception:
+                # slow or rate limited embedding api, answer from the lexical index
+                self.vector_failed()
+            else:
+                chunks.update(vector_chunks)
+                rankings.append(list(vector_chunks))
+
+        return [
+            chunks[chunk_id]
+            for chunk_id in reciprocal_rank_fusion(rankings)[:n_results]
+        ]
+
+    def vector_available(self):
+        return time.monotonic() >= self.vector_unavailable_until
 
-        if self.results["documents"][0]:
-            return [
-                {"text": texts, "start": start}
-                for texts, start in zip(
-                    self.results["documents"][0],
-                    [int(i["start"]) for i in self.results["metadatas"][0]],
+    def vector_failed(self):
+        METRICS.count("lexical_fallbacks")
+        self.vector_unavailable_until = time.monotonic() + self.vector_cooldown
+
+
+class AsyncVectorStore:
+    # add and retrieve as coroutines over a VectorStore's collection and
+    # indexes; embeddings come from an AsyncGeminiLLM, chroma has no async
+    # local client, so collection and index work runs on the default thread pool
+    def __init__(self, vector_store, llm):
+        self.vector_store = vector_store
+        self.llm = llm
+
+    async def embed_batch(self, documents):
+        unique_documents = list(dict.fromkeys(documents))
+        with METRICS.span("embed_batch"):
+            embeddings = dict(
+                zip(unique_documents, await self.llm.embed(unique_documents))
+            )
+        return [embeddings[document] for document in documents]
+
+    async def add_documents(self, documents, timestamps, video_id, start_index=0):
+        with METRICS.span("vector_store_add"):
+            await self._add_documents(documents, timestamps, video_id, start_index)
+        METRICS.count("chunks_indexed", len(documents))
+
+    async def _add_documents(self, documents, timestamps, video_id, start_index):
+        vector_store = self.vector_store
+        batch_size = vector_store.batch_size
+        batch_starts = range(0, len(documents), batch_size)
+        semaphore = asyncio.Semaphore(max(1, vector_store.max_workers))
+
+        async def embed(i):
+            async with semaphore:
+                return await self.embed_batch(documents[i : i + batch_size])
+
+        # embedding requests run concurrently, writes stay in batch order
+        tasks = [asyncio.create_task(embed(i)) for i in batch_starts]
+        all_embeddings = []
+        try:
+            for i, task in zip(batch_starts, tasks):
+                embeddings = await task
+                if vector_store.local_index:
+                    all_embeddings.extend(embeddings)
+                await asyncio.to_thread(
+                    vector_store.store_batch,
+                    documents[i : i + batch_size],
+                    timestamps[i : i + batch_size],
+                    embeddings,
+                    video_id,
+                    start_index + i,
                 )
-            ]
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        else:
-            return []
+        await asyncio.to_thread(
+            vector_store.update_indexes,
+            documents,
+            timestamps,
+            all_embeddings,
+            video_id,
+            start_index,
+        )
+
+    async def vector_search(self, query, video_id, n_results):
+        vector_store = self.vector_store
+        vector_index = None
+        if vector_store.local_index:
+            vector_index = await asyncio.to_thread(
+                vector_store.local_vector_index, video_id
+            )
+        query_embedding = (await self.llm.embed([query], priority=INTERACTIVE))[0]
+        if vector_index is not None:
+            return vector_store.local_search(vector_index, query_embedding, n_results)
+        return await asyncio.to_thread(
+            vector_store.collection_search,
+            video_id,
+            n_results,
+            query_embeddings=[query_embedding],
+        )
+
+    async def retrieve_documents(self, query, video_id, n_results=5, mode="hybrid"):
+        with METRICS.span("retrieve", mode=mode):
+            return await self._retrieve_documents(query, video_id, n_results, mode)
+
+    async def _retrieve_documents(self, query, video_id, n_results, mode):
+        vector_store = self.vector_store
+        if mode == "vector":
+            return list((await self.vector_search(query, video_id, n_results)).values())
+
+        candidates = max(4 * n_results, 20)
+        vector_task = None
+        if mode == "hybrid" and vector_store.vector_available():
+            vector_task = asyncio.create_task(
+                self.vector_search(query, video_id, candidates)
+            )
+
+        chunks = await asyncio.to_thread(
+            vector_store.lexical_search, query, video_id, candidates
+        )
+        rankings = [list(chunks)]
+
+        if vector_task is not None:
+            try:
+                vector_chunks = await asyncio.wait_for(
+                    vector_task, vector_store.vector_timeout
+                )
+            except Exception:
+                vector_store.vector_failed()
+            else:
+                chunks.update(vector_chunks)
+                rankings.append(list(vector_chunks))
+
+        return [
+            chunks[chunk_id]
+            for chunk_id in reciprocal_rank_fusion(rankings)[:n_results]
+        ]
+
+
+class IncrementalIndexer:
+    def __init__(
+        self,
+        vector_store,
+        video_id,
+        batch_size=100,
+        first_batch_size=25,
+        manifest=None,
+        progress=None,
+    ):
+        self.vector_store = vector_store
+        self.video_id = video_id
+        self.manifest = manifest
+        self.progress = progress
+        self.batch_size = batch_size
+        self.first_batch_size = first_batch_size
+
+        self.chunks = []
+        self.timestamps = []
+        self.indexed = 0
+        self.error = None
+        self.first_batch = threading.Event()
+        self.finished = threading.Event()
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def flush(self):
+        if self.indexed < len(self.chunks):
+            self.vector_store.add_documents(
+                self.chunks[self.indexed :],
+                self.timestamps[self.indexed :],
+                self.video_id,
+                start_index=self.indexed,
+            )
+            self.indexed = len(self.chunks)
+
+            if self.manifest is not None:
+                self.manifest.update(self.video_id, chunk_count=self.indexed)
+            if self.progress is not None:
+                self.progress(self.indexed)
+            self.first_batch.set()
+
+    def index(self, chunks_with_timestamps):
+        # embed and store each batch as soon as it fills up; a smaller first
+        # batch makes the video searchable sooner
+        try:
+            for chunk, timestamp in chunks_with_timestamps:
+                self.chunks.append(chunk)
+                self.timestamps.append(timestamp)
+
+                batch_size = self.batch_size if self.indexed else self.first_batch_size
+                if len(self.chunks) - self.indexed >= batch_size:
+                    self.flush()
+            self.flush()
+            if not self.indexed:
+                raise ValueError("The transcript is empty")
+            self.vector_store.delete_from(self.video_id, self.indexed)
+            if self.manifest is not None:
+                self.manifest.mark_ready(self.video_id, self.indexed)
+        except Exception as error:
+            self.error = error
+            if self.manifest is not None:
+                self.manifest.mark_failed(self.video_id, error)
+        finally:
+            self.first_batch.set()
+            self.finished.set()
+
+    def start(self, chunks_with_timestamps):
+        self.thread = threading.Thread(
+            target=self.index, args=(chunks_with_timestamps,), daemon=True
+        )
+        self.thread.start()
+        return self
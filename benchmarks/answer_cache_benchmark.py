@@ -0,0 +1,121 @@
+import argparse
+import random
+import tempfile
+import time
+
+from benchmarks.fakes import BagOfWordsEmbedding, FakeGeminiLLM
+from benchmarks.retrieval_benchmark import fixture_transcript, percentile
+from DataBases.VectorStore import VectorStore
+from utils.Cache import AnswerCache
+
+
+class MemoizedEmbedding(BagOfWordsEmbedding):
+    # the app's embedding cache: retrieval reuses the question's embedding
+    def __init__(self, latency):
+        super().__init__(latency)
+        self.memo = {}
+
+    def embed(self, input):
+        missing = [text for text in input if text not in self.memo]
+        if missing:
+            self.memo.update(zip(missing, super().embed(missing)))
+        return [self.memo[text] for text in input]
+
+
+def variants(question):
+    # how the same question comes back: verbatim, retyped, reworded
+    words = question.rstrip("?").split()
+    return [
+        question,
+        question.lower().rstrip("?"),
+        " ".join([words[1].capitalize(), *words[2:], words[0].lower()]) + "?",
+    ]
+
+
+def question_stream(videos, n_questions, seed=0):
+    # a few popular questions per video get most of the traffic
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(n_questions):
+        video_id = rng.choice(list(videos))
+        questions = videos[video_id]
+        weights = [1 / rank for rank in range(1, len(questions) + 1)]
+        question = rng.choices(questions, weights)[0]
+        stream.append((video_id, question, rng.choice(variants(question))))
+    return stream
+
+
+def run_mode(name, vector_store, llm, stream, answer_cache):
+    latencies, answered_from, wrong = [], {}, 0
+    for video_id, question, asked in stream:
+        start = time.perf_counter()
+        answer = None
+        embedding = None
+        if answer_cache is not None:
+            if answer_cache.similarity <= 1.0:
+                embedding = vector_store.embedding_function.embed_query([asked])[0]
+            answer = answer_cache.get(video_id, asked, embedding)
+            # a near duplicate that was really another question
+            wrong += answer is not None and answered_from[answer] != question
+
+        if answer is None:
+            chunks = vector_store.retrieve_documents(asked, video_id, n_results=8)
+            answer = llm.TextLLM(
+                f"{video_id} {question} {len(chunks)}", [], asked, model_name="fake"
+            )
+            answered_from[answer] = question
+            if answer_cache is not None:
+                answer_cache.set(
+                    video_id, asked, answer, time.perf_counter() - start, embedding
+                )
+        latencies.append(time.perf_counter() - start)
+
+    stats = answer_cache.stats() if answer_cache is not None else {}
+    print(
+        f"{name:<10} p50={percentile(latencies, 50) * 1000:6.0f}ms "
+        f"mean={sum(latencies) / len(latencies) * 1000:6.0f}ms "
+        f"hit_rate={stats.get('hit_rate', 0.0):.2f} "
+        f"(exact={stats.get('exact_hits', 0)} similar={stats.get('similar_hits', 0)}) "
+        f"saved={stats.get('seconds_saved', 0.0):6.1f}s wrong={wrong}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=4)
+    parser.add_argument("--questions-per-video", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--similarity", type=float, default=0.95)
+    args = parser.parse_args()
+
+    embedding_function = MemoizedEmbedding(latency=0)
+    vector_store = VectorStore(
+        None, path=tempfile.mkdtemp(), embedding_function=embedding_function
+    )
+    videos = {}
+    for index in range(args.videos):
+        video_id = f"video{index:06d}"
+        chunks, queries = fixture_transcript(
+            200, args.questions_per_video, seed=index
+        )
+        vector_store.add_documents(chunks, [float(i) for i in range(200)], video_id)
+        videos[video_id] = [
+            query for query, relevant in queries if isinstance(relevant, int)
+        ]
+    stream = question_stream(videos, args.questions)
+    print(
+        f"{args.questions} first questions about {args.videos} videos, "
+        f"generation latency={args.latency}s"
+    )
+
+    embedding_function.latency = args.embedding_latency
+    llm = FakeGeminiLLM(latency=args.latency)
+    for name, answer_cache in [
+        ("no cache", None),
+        ("exact", AnswerCache(similarity=float("inf"))),
+        ("similar", AnswerCache(similarity=args.similarity)),
+    ]:
+        embedding_function.memo.clear()
+        run_mode(name, vector_store, llm, stream, answer_cache)
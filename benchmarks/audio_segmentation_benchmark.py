@@ -0,0 +1,207 @@
+import argparse
+import csv
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from utils.AudioDownloader import AudioDownloader
+
+
+def generate_audio(path, duration, bitrate="128k", movflags=None):
+    # stereo tone encoded like the 128kbps m4a streams we download
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:duration={duration}",
+            "-ac",
+            "2",
+            "-c:a",
+            "aac",
+            "-b:a",
+            bitrate,
+            *(["-movflags", movflags] if movflags else []),
+            path,
+        ],
+        check=True,
+    )
+
+
+def split_with_pydub(audio_path, max_segment_bytes):
+    # decodes the whole file into memory
+    audio = AudioSegment.from_file(audio_path)
+    no_of_required_chunks = int(
+        np.ceil(os.path.getsize(audio_path) / max_segment_bytes)
+    )
+    segments = np.linspace(0, len(audio) + 1, no_of_required_chunks + 1)
+
+    temp_audio_paths = []
+    for start_pt, end_pt in zip(segments[:-1], segments[1:]):
+        with tempfile.NamedTemporaryFile(
+            suffix=".mp3", delete=False
+        ) as temp_audio_chunk:
+            audio[start_pt:end_pt].export(temp_audio_chunk.name, format="mp3")
+            temp_audio_paths.append(temp_audio_chunk.name)
+
+    return temp_audio_paths, [float(start_pt) / 1000 for start_pt in segments[:-1]]
+
+
+def split_with_ffmpeg(audio_path, duration, max_segment_bytes):
+    # stream copy of a downloaded file, what the app did before segmenting
+    # the download as it streams in
+    audio_size = os.path.getsize(audio_path)
+    # aim a little under the limit, stream copy cuts on packet boundaries
+    no_of_required_chunks = int(np.ceil(audio_size / (max_segment_bytes * 0.9)))
+    segment_time = duration / no_of_required_chunks + 1
+
+    output_directory = tempfile.mkdtemp()
+    segment_list = os.path.join(output_directory, "segments.csv")
+    try:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-i",
+                audio_path,
+                "-map",
+                "0:a",
+                "-c",
+                "copy",
+                "-f",
+                "segment",
+                "-segment_time",
+                f"{segment_time:.3f}",
+                "-reset_timestamps",
+                "1",
+                "-segment_list",
+                segment_list,
+                "-segment_list_type",
+                "csv",
+                os.path.join(output_directory, "segment%04d.m4a"),
+            ],
+            check=True,
+        )
+
+        temp_audio_paths, segment_start_times = [], []
+        with open(segment_list, newline="") as file:
+            for filename, start, end in csv.reader(file):
+                temp_audio_paths.append(
+                    AudioDownloader.claim_segment(
+                        os.path.join(output_directory, filename)
+                    )
+                )
+                segment_start_times.append(float(start))
+        return temp_audio_paths, segment_start_times
+    finally:
+        shutil.rmtree(output_directory, ignore_errors=True)
+
+
+def split_once(mode, audio_path, duration, max_segment_bytes):
+    # works on a copy, like the app did with each downloaded file
+    work_path = tempfile.NamedTemporaryFile(suffix=".m4a", delete=False).name
+    shutil.copyfile(audio_path, work_path)
+
+    start = time.perf_counter()
+    if mode == "ffmpeg":
+        paths, start_times = split_with_ffmpeg(work_path, duration, max_segment_bytes)
+    else:
+        paths, start_times = split_with_pydub(work_path, max_segment_bytes)
+    elapsed = time.perf_counter() - start
+
+    sizes = [os.path.getsize(path) for path in paths]
+    for path in paths + [work_path]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "seconds": elapsed,
+                "segments": len(paths),
+                "max_segment_mb": max(sizes) / 1024**2,
+                "start_times": start_times,
+                # ru_maxrss is in KiB on Linux, children covers the ffmpeg process
+                "python_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+                "ffmpeg_peak_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+                / 1024,
+            }
+        )
+    )
+
+
+def run(duration, modes, max_segment_bytes):
+    audio_path = os.path.join(tempfile.mkdtemp(), "synthetic.m4a")
+    generate_audio(audio_path, duration)
+    print(
+        f"audio: {duration / 60:.0f} min, {os.path.getsize(audio_path) / 1024**2:.1f} MB"
+    )
+
+    for mode in modes:
+        # one process per mode, so peak memory is not shared between them
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.audio_segmentation_benchmark",
+                "--split",
+                mode,
+                audio_path,
+                "--duration",
+                str(duration),
+                "--max-segment-mb",
+                str(max_segment_bytes / 1024**2),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            print(f"{mode:<7} failed: {process.stderr.strip().splitlines()[-1]}")
+            continue
+
+        result = json.loads(process.stdout)
+        print(
+            f"{mode:<7} time={result['seconds']:.2f}s segments={result['segments']} "
+            f"largest={result['max_segment_mb']:.1f}MB "
+            f"python_peak={result['python_peak_mb']:.0f}MB "
+            f"ffmpeg_peak={result['ffmpeg_peak_mb']:.0f}MB "
+            f"starts={[round(start, 2) for start in result['start_times']]}"
+        )
+
+    os.remove(audio_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=3600)
+    parser.add_argument("--modes", nargs="+", default=["ffmpeg", "pydub"])
+    parser.add_argument("--max-segment-mb", type=float, default=15)
+    parser.add_argument("--split", nargs=2, metavar=("MODE", "PATH"))
+    args = parser.parse_args()
+
+    if args.split:
+        split_once(
+            args.split[0],
+            args.split[1],
+            args.duration,
+            int(args.max_segment_mb * 1024**2),
+        )
+    else:
+        run(args.duration, args.modes, int(args.max_segment_mb * 1024**2))
@@ -0,0 +1,90 @@
+import argparse
+import random
+import time
+
+from benchmarks.fakes import synthetic_transcript
+from utils.HelperFunctions import iter_chunk_spans
+
+
+def check_chunks(items, spans, chunk_size, overlap):
+    # invariants of iter_chunk_spans, raises AssertionError on a violation
+    previous_start = previous_end = float("-inf")
+    for text, start, end in spans:
+        assert text and len(text) <= chunk_size, (len(text), chunk_size)
+        assert start <= end, (start, end)
+        assert start >= previous_start, (previous_start, start)
+        assert end >= previous_end, (previous_end, end)
+        previous_start, previous_end = start, end
+
+    if spans:
+        assert spans[0][1] == min(float(item["start"]) for item in items)
+
+    words = " ".join(item["text"] for item in items).split()
+    chunk_words = " ".join(text for text, _, _ in spans).split()
+    if overlap == 0:
+        assert chunk_words == words
+    else:
+        assert set(chunk_words) == set(words)
+        assert len(words) <= len(chunk_words)
+
+
+def property_checks(trials, seed=0):
+    rng = random.Random(seed)
+    for trial in range(trials):
+        items = synthetic_transcript(
+            rng.uniform(0.01, 0.2),
+            seconds_per_segment=rng.uniform(0.5, 10),
+            style=rng.choice(["youtube", "whisper"]),
+            seed=trial,
+        )
+        chunk_size = rng.randint(20, 1000)
+        overlap = rng.choice([0, rng.randint(0, chunk_size - 1)])
+        spans = list(
+            iter_chunk_spans(items, chunk_size, overlap, rng.random() < 0.8)
+        )
+        check_chunks(items, spans, chunk_size, overlap)
+    print(f"property checks: {trials} random transcripts passed")
+
+
+def run(hours_list, chunk_size, overlap, style):
+    print(f"style={style} chunk_size={chunk_size} overlap={overlap}")
+    for hours in hours_list:
+        items = synthetic_transcript(hours, style=style)
+        chars = sum(len(item["text"]) for item in items)
+
+        start = time.perf_counter()
+        spans = list(iter_chunk_spans(items, chunk_size, overlap))
+        elapsed = time.perf_counter() - start
+
+        check_chunks(items, spans, chunk_size, overlap)
+        print(
+            f"hours={hours:<5} segments={len(items):<7} chars={chars:<10,} "
+            f"chunks={len(spans):<6} wall={elapsed:.3f}s "
+            f"{chars / elapsed / 1e6:.2f}M chars/s"
+        )
+
+
+def run_on(sizes, chunk_size):
+    # one unpunctuated segment, the case the old chunker was quadratic on
+    for size in sizes:
+        words = ("run on words without any full stop " * (size // 35 + 1))[:size]
+        items = [{"text": words, "start": 0.0, "duration": size / 15}]
+        start = time.perf_counter()
+        spans = list(iter_chunk_spans(items, chunk_size))
+        elapsed = time.perf_counter() - start
+        check_chunks(items, spans, chunk_size, 0)
+        print(f"run-on segment chars={size:<10,} wall={elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 2.5, 5, 10])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--trials", type=int, default=200)
+    args = parser.parse_args()
+
+    property_checks(args.trials)
+    for style in ["youtube", "whisper"]:
+        run(args.hours, args.chunk_size, args.overlap, style)
+    run_on([10_000, 100_000, 1_000_000], args.chunk_size)
@@ -0,0 +1,465 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import (
+    FakeGenaiClient,
+    FakeGroqClient,
+    FakeYouTubeTranscriptApi,
+    synthetic_transcript,
+)
+from benchmarks.retrieval_benchmark import percentile
+from DataBases.TranscriptCache import TranscriptCache
+from DataBases.VectorStore import AsyncVectorStore, VectorStore
+from utils.Cache import EmbeddingCache
+from utils.HelperFunctions import (
+    create_chunks_with_timestamps,
+    encode_audio,
+    wave_bytesio,
+)
+from utils.LLM import AsyncGeminiLLM, GeminiLLM, GroqLLM
+from utils.Summarizer import Summarizer
+from utils.Transcript import Transcript
+
+STAGES = [
+    "transcript",
+    "audio",
+    "chunking",
+    "vector_store",
+    "summarize",
+    "answer",
+    "users",
+]
+
+
+def measure(function, items, units=lambda item, result: 1):
+    # calls function once per item, failed calls count as errors, not latency
+    latencies, errors, first_error, total_units = [], 0, None, 0
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        try:
+            result = function(item)
+        except Exception as error:
+            errors += 1
+            first_error = first_error or f"{type(error).__name__}: {error}"[:200]
+            continue
+        latencies.append(time.perf_counter() - call_start)
+        total_units += units(item, result)
+    return summary(latencies, errors, first_error, total_units, start)
+
+
+def summary(latencies, errors, first_error, total_units, start):
+    wall = time.perf_counter() - start
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "first_error": first_error,
+        "throughput": total_units / wall if wall else 0.0,
+        "p50": percentile(latencies, 50) if latencies else None,
+        "p95": percentile(latencies, 95) if latencies else None,
+        "p99": percentile(latencies, 99) if latencies else None,
+    }
+
+
+def gemini_llm(args, embedding_cache=None):
+    llm = GeminiLLM("fake", embedding_cache=embedding_cache, backoff=0.05)
+    llm.llm = FakeGenaiClient(
+        latency=args.gemini_latency,
+        embed_latency=args.embed_latency,
+        error_rate=args.error_rate,
+    )
+    return llm
+
+
+def fixture(args):
+    return synthetic_transcript(args.hours, style="youtube")
+
+
+def stage_transcript(args):
+    # the second pass reads the same videos from the on-disk transcript cache
+    transcript = Transcript(
+        FakeYouTubeTranscriptApi(
+            fixture(args), latency=args.youtube_latency, error_rate=args.error_rate
+        ),
+        cache=TranscriptCache(tempfile.mkdtemp()),
+    )
+    video_ids = [f"video{i:06d}" for i in range(args.videos)]
+    return {
+        name: measure(
+            transcript.with_youtube_api,
+            video_ids,
+            lambda video_id, items: len(items),
+        )
+        for name in ["fetch", "fetch_cached"]
+    }
+
+
+def stage_audio(args):
+    # generated audio through the real segmenter and whisper stream
+    if shutil.which("ffmpeg") is None:
+        return {"skipped": "ffmpeg not found"}
+
+    from benchmarks.audio_segmentation_benchmark import generate_audio
+    from benchmarks.whisper_pipeline_benchmark import LocalAudioDownloader
+
+    audio_path = os.path.join(tempfile.mkdtemp(), "synthetic.m4a")
+    generate_audio(audio_path, args.audio_seconds, movflags="+frag_keyframe+empty_moov")
+
+    def transcribe(video_id):
+        llm = GroqLLM("fake", backoff=0.01)
+        llm.llm = FakeGroqClient(
+            latency=args.groq_latency, error_rate=args.error_rate
+        )
+        return Transcript().with_whisper_stream(
+            "fake",
+            video_id,
+            audio_downloader=LocalAudioDownloader(
+                audio_path, 4 * 1024**2, max_segment_bytes=2 * 1024**2
+            ),
+            llm=llm,
+        )
+
+    try:
+        return {
+            "whisper_stream": measure(
+                lambda video_id: [part for part in transcribe(video_id)],
+                ["local"],
+                lambda video_id, parts: args.audio_seconds,
+            )
+        }
+    finally:
+        os.remove(audio_path)
+
+
+def stage_chunking(args):
+    items = fixture(args)
+    chars = sum(len(item["text"]) for item in items)
+    return {
+        "chunk": measure(
+            create_chunks_with_timestamps, [items] * 5, lambda items, result: chars
+        )
+    }
+
+
+def stage_vector_store(args):
+    chunks, timestamps = create_chunks_with_timestamps(fixture(args))
+    vector_store = VectorStore(
+        None,
+        path=tempfile.mkdtemp(),
+        embedding_function=gemini_llm(args, EmbeddingCache()),
+    )
+    videos = [f"video{i:06d}" for i in range(args.videos)]
+    # every video gets its own text, so the embedding cache does not hide the api
+    index = measure(
+        lambda video_id: vector_store.add_documents(
+            [f"{video_id} {chunk}" for chunk in chunks], timestamps, video_id
+        ),
+        videos,
+        lambda video_id, result: len(chunks),
+    )
+
+    queries = [chunk[:80] for chunk in chunks[:: max(1, len(chunks) // 20)]]
+    return {
+        "index": index,
+        "retrieve": measure(
+            lambda query: vector_store.retrieve_documents(query, videos[0]),
+            queries * 5,
+        ),
+    }
+
+
+def stage_summarize(args):
+    chunks, _ = create_chunks_with_timestamps(fixture(args))
+    summarizer = Summarizer(None, llm=gemini_llm(args))
+    return {
+        "summarize": measure(
+            lambda video_id: summarizer.summarize_transcript(
+                [f"{video_id} {chunk}" for chunk in chunks]
+            ),
+            [f"video{i:06d}" for i in range(max(1, args.videos // 4))],
+            lambda video_id, summary: sum(len(chunk) for chunk in chunks),
+        )
+    }
+
+
+def stage_answer(args):
+    llm = gemini_llm(args)
+    first_tokens = []
+
+    def answer(query):
+        start = time.perf_counter()
+        texts = []
+        for text in llm.TextLLMStream("Context: " + "lorem ipsum " * 500, [], query):
+            if not texts:
+                first_tokens.append(time.perf_counter() - start)
+            texts.append(text)
+        return "".join(texts)
+
+    queries = [f"Question {i} about the video?" for i in range(args.videos)]
+    results = {"answer": measure(answer, queries)}
+    if first_tokens:
+        results["answer"]["first_token_p50"] = percentile(first_tokens, 50)
+    # one request for the whole summary against sentence-aligned parts in parallel
+    summaries = [
+        " ".join(f"Sentence {j} of summary {i} about the video." for j in range(40))
+        for i in range(max(1, args.videos // 4))
+    ]
+    results["tts"] = measure(
+        lambda summary: llm.TTS(summary), summaries, lambda summary, pcm: len(pcm)
+    )
+    first_parts = []
+
+    def tts_stream(summary):
+        start = time.perf_counter()
+        pcm = []
+        for part in llm.TTSStream(summary):
+            if not pcm:
+                first_parts.append(time.perf_counter() - start)
+            pcm.append(part)
+        return b"".join(pcm)
+
+    results["tts_stream"] = measure(
+        tts_stream, summaries, lambda summary, pcm: len(pcm)
+    )
+    results["tts_stream"]["first_part_p50"] = percentile(first_parts, 50)
+
+    pcm = llm.TTS(summaries[0])
+    audio, audio_format = encode_audio(pcm)
+    results["tts_bytes"] = {
+        "wav": len(wave_bytesio(pcm).getvalue()),
+        f"encoded_{audio_format}": len(audio),
+    }
+    return results
+
+
+def stage_users(args):
+    # concurrent users each retrieving and answering one question, on a thread
+    # pool the size of a worker's against one event loop for all of them
+    chunks, timestamps = create_chunks_with_timestamps(fixture(args))
+    llm = gemini_llm(args)
+    async_llm = AsyncGeminiLLM("fake", backoff=0.05)
+    async_llm.llm = llm.llm.aio
+    vector_store = VectorStore(
+        None, path=tempfile.mkdtemp(), embedding_function=llm, local_index=True
+    )
+    vector_store.add_documents(chunks, timestamps, "video")
+    async_vector_store = AsyncVectorStore(vector_store, async_llm)
+    queries = [
+        f"Question {i} about {chunks[i % len(chunks)][:40]}?"
+        for i in range(args.users)
+    ]
+    threads = []
+
+    def user(query):
+        context = vector_store.retrieve_documents(query, "video")
+        threads.append(threading.active_count())
+        return llm.TextLLM(f"Context: {context}", [], query)
+
+    async def async_user(query):
+        context = await async_vector_store.retrieve_documents(query, "video")
+        threads.append(threading.active_count())
+        return await async_llm.TextLLM(f"Context: {context}", [], query)
+
+    def run_threads():
+        start = time.perf_counter()
+
+        def timed(query):
+            call_start = time.perf_counter()
+            try:
+                user(query)
+            except Exception as error:
+                return None, f"{type(error).__name__}: {error}"[:200]
+            return time.perf_counter() - call_start, None
+
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            outcomes = list(executor.map(timed, queries))
+        return outcomes, start
+
+    async def run_async():
+        start = time.perf_counter()
+
+        async def timed(query):
+            call_start = time.perf_counter()
+            try:
+                await async_user(query)
+            except Exception as error:
+                return None, f"{type(error).__name__}: {error}"[:200]
+            return time.perf_counter() - call_start, None
+
+        return await asyncio.gather(*(timed(query) for query in queries)), start
+
+    results = {}
+    for name, run_all in [
+        ("threads", run_threads),
+        ("asyncio", lambda: asyncio.run(run_async())),
+    ]:
+        threads.clear()
+        outcomes, start = run_all()
+        latencies = [latency for latency, _ in outcomes if latency is not None]
+        errors = [error for _, error in outcomes if error is not None]
+        results[name] = summary(
+            latencies, len(errors), errors[0] if errors else None, len(latencies), start
+        )
+        results[name]["peak_threads"] = max(threads, default=0)
+    return results
+
+
+def run_stage(name, args):
+    results = globals()[f"stage_{name}"](args)
+    print(
+        json.dumps(
+            {
+                "stage": name,
+                "results": results,
+                # ru_maxrss is in KiB on Linux
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+            }
+        )
+    )
+
+
+def stage_arguments(args):
+    return [
+        f"--{name.replace('_', '-')}={value}"
+        for name, value in vars(args).items()
+        if name not in ("stage", "stages", "baseline", "save_baseline", "tolerance")
+    ]
+
+
+def fmt(value, scale=1000, digits=1):
+    return "-" if value is None else f"{value * scale:.{digits}f}"
+
+
+def compare(report, baseline, tolerance):
+    # slower percentiles, lower throughput or more memory than the baseline
+    regressions = []
+    for stage, entry in report.items():
+        base_entry = baseline.get(stage)
+        if "results" not in entry or "results" not in (base_entry or {}):
+            continue
+        checks = [("peak_rss_mb", entry["peak_rss_mb"], base_entry["peak_rss_mb"], 1)]
+        for name, result in entry["results"].items():
+            base = base_entry["results"].get(name)
+            if not isinstance(result, dict) or not isinstance(base, dict):
+                continue
+            for metric in ["p50", "p95"]:
+                if result.get(metric) and base.get(metric):
+                    checks.append((f"{name}.{metric}", result[metric], base[metric], 1))
+            if result.get("throughput") and base.get("throughput"):
+                checks.append(
+                    (
+                        f"{name}.throughput",
+                        result["throughput"],
+                        base["throughput"],
+                        -1,
+                    )
+                )
+
+        for metric, value, base, direction in checks:
+            change = (value - base) / base
+            marker = ""
+            if change * direction > tolerance:
+                marker = "  REGRESSION"
+                regressions.append(f"{stage}.{metric}")
+            print(
+                f"  {stage + '.' + metric:<34}{base:14.4f} -> {value:14.4f} "
+                f"{change:+8.1%}{marker}"
+            )
+    return regressions
+
+
+def run(args):
+    print(
+        f"fixture: {args.hours}h transcript, {args.videos} videos, "
+        f"error rate {args.error_rate}"
+    )
+    print(
+        f"{'stage':<28}{'ops':>6}{'errors':>8}{'throughput/s':>16}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}"
+    )
+
+    report = {}
+    for stage in args.stages:
+        # one process per stage, so peak memory is not shared between them
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.e2e_benchmark",
+                "--stage",
+                stage,
+                *stage_arguments(args),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            print(f"{stage:<28}failed: {process.stderr.strip().splitlines()[-1]}")
+            report[stage] = {"failed": process.stderr.strip().splitlines()[-1]}
+            continue
+
+        entry = json.loads(process.stdout.strip().splitlines()[-1])
+        report[stage] = entry
+        for name, result in entry["results"].items():
+            if not isinstance(result, dict) or "ops" not in result:
+                print(f"{stage + '.' + name:<28}{result}")
+                continue
+            print(
+                f"{stage + '.' + name:<28}{result['ops']:>6}{result['errors']:>8}"
+                f"{result['throughput']:>16,.1f}{fmt(result['p50']):>10}"
+                f"{fmt(result['p95']):>10}{fmt(result['p99']):>10}"
+                f"{entry['peak_rss_mb']:>10.0f}"
+            )
+            if result["first_error"]:
+                print(f"{'':<28}first error: {result['first_error']}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        print(f"against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--videos", type=int, default=8)
+    parser.add_argument("--audio-seconds", type=float, default=600)
+    parser.add_argument("--youtube-latency", type=float, default=0.3)
+    parser.add_argument("--groq-latency", type=float, default=1.0)
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--baseline", help="compare against this saved report")
+    parser.add_argument("--save-baseline", help="write this run's report here")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args.stage, args)
+    else:
+        run(args)
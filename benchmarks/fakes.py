@@ -0,0 +1,443 @@
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+from google.genai.errors import ClientError
+from groq import RateLimitError
+
+from utils.RateLimiter import TokenBucket
+
+
+def synthetic_sentences(n_sentences, seed=0):
+    rng = random.Random(seed)
+    words = (
+        "ocean deep sea creature oxygen nodule metal pressure light mining "
+        "scientist research energy mystery discovery sample camera robot"
+    ).split()
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize()
+        + "."
+        for _ in range(n_sentences)
+    ]
+
+
+def synthetic_transcript(hours, seconds_per_segment=3.0, style="youtube", seed=0):
+    # youtube captions: short unpunctuated lines with durations; whisper
+    # segments: punctuated sentences without durations, now and then a long
+    # run-on segment
+    rng = random.Random(seed)
+    sentences = synthetic_sentences(2000, seed)
+    items, start = [], 0.0
+    while start < hours * 3600:
+        if style == "youtube":
+            text = rng.choice(sentences).lower().rstrip(".")
+            duration = seconds_per_segment * rng.uniform(0.5, 1.5)
+            items.append({"text": text, "start": start, "duration": duration})
+        else:
+            count = 40 if rng.random() < 0.01 else rng.randint(1, 3)
+            text = " ".join(rng.choice(sentences) for _ in range(count))
+            if count == 40:
+                text = text.replace(".", "")
+            duration = seconds_per_segment * count
+            items.append({"text": text, "start": start})
+        start += duration
+    return items
+
+
+class FakeGeminiLLM:
+    def __init__(self, latency=0.5, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def TextLLM(self, system_instruction, history, query, model_name="fake"):
+        with self.lock:
+            self.calls += 1
+            fail = self.rng.random() < self.error_rate
+
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("fake Gemini error")
+
+        # a summary is roughly a hundredth of its input
+        return system_instruction[-max(200, len(system_instruction) // 100) :]
+
+
+class FakeGroqClient:
+    # stands in for groq.Groq, only the transcription endpoint
+    def __init__(self, latency=1.0, segment_seconds=5.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.segment_seconds = segment_seconds
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.audio = self
+        self.transcriptions = self
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def create(self, file, language, model, response_format):
+        fail = self.draw()
+        time.sleep(self.latency)
+        return self.transcription(file, fail)
+
+    def draw(self):
+        with self.lock:
+            self.calls += 1
+            fail = self.rng.random() < self.error_rate
+            self.errors += fail
+        return fail
+
+    def transcription(self, file, fail):
+        if fail:
+            request = httpx.Request("POST", "https://api.groq.com/openai/v1/audio")
+            raise RateLimitError(
+                "fake rate limit",
+                response=httpx.Response(
+                    429, request=request, headers={"retry-after": "0"}
+                ),
+                body=None,
+            )
+        return FakeTranscription(
+            [
+                {
+                    "text": f" segment of {file[0]} ",
+                    "start": start * self.segment_seconds,
+                    "end": (start + 1) * self.segment_seconds,
+                }
+                for start in range(3)
+            ]
+        )
+
+
+class FakeAsyncGroqClient(FakeGroqClient):
+    # stands in for groq.AsyncGroq
+    async def create(self, file, language, model, response_format):
+        fail = self.draw()
+        await asyncio.sleep(self.latency)
+        return self.transcription(file, fail)
+
+
+class FakeTranscription:
+    def __init__(self, segments):
+        self.segments = segments
+
+
+def local_chunks(path, chunk_size=256 * 1024, bytes_per_second=None):
+    # stands in for pytubefix Stream.iter_chunks, optionally throttled like a download
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            if bytes_per_second:
+                time.sleep(len(chunk) / bytes_per_second)
+            yield chunk
+
+
+class FakeEmbedding:
+    # same interface as GeminiLLM when used as a chroma embedding function
+    def __init__(self, latency=0.3, dimensions=768):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+
+    def embed(self, input):
+        with self.lock:
+            self.calls += 1
+            self.texts += len(input)
+        time.sleep(self.latency)
+
+        return [self.vector(text) for text in input]
+
+    def vector(self, text):
+        # deterministic pseudo-random unit vectors, similar texts are not similar
+        rng = random.Random(text)
+        vector = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = sum(value * value for value in vector) ** 0.5
+        return [value / norm for value in vector]
+
+    def __call__(self, input):
+        return self.embed(input)
+
+    def embed_query(self, input):
+        return self.embed(input)
+
+    def name(self):
+        return "fake_embedding"
+
+
+class BagOfWordsEmbedding(FakeEmbedding):
+    # hashed word counts, texts that share words get similar vectors
+    def __init__(self, latency=0.1, dimensions=768, error=None):
+        super().__init__(latency, dimensions)
+        self.error = error
+
+    def embed(self, input):
+        if self.error is not None:
+            raise self.error
+        return super().embed(input)
+
+    def vector(self, text):
+        vector = [0.0] * self.dimensions
+        for word in text.lower().replace("?", " ").replace(".", " ").split():
+            rng = random.Random(word)
+            vector[rng.randrange(self.dimensions)] += rng.choice((-1.0, 1.0))
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+
+class FakeGenaiClient:
+    # stands in for genai.Client: chats, embed_content and generate_content
+    # (tts), with latency per call and a share of 429 errors; aio is the
+    # async client. with quota_per_minute, calls over a token bucket of that
+    # many requests a minute are rejected with a 429 at once
+    def __init__(
+        self,
+        latency=0.5,
+        embed_latency=0.1,
+        error_rate=0.0,
+        dimensions=768,
+        tts_bytes_per_char=3200,
+        tts_seconds_per_char=0.002,
+        quota_per_minute=None,
+        seed=0,
+    ):
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.error_rate = error_rate
+        self.quota = quota_per_minute and TokenBucket(quota_per_minute)
+        self.rejected = 0
+        self.embedding = FakeEmbedding(latency=0, dimensions=dimensions)
+        # about 15 characters of speech a second as 24kHz 16-bit pcm
+        self.tts_bytes_per_char = tts_bytes_per_char
+        self.tts_seconds_per_char = tts_seconds_per_char
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {"chat": 0, "embed": 0, "tts": 0}
+        self.errors = 0
+
+        self.models = SimpleNamespace(
+            embed_content=self.embed_content, generate_content=self.generate_content
+        )
+        self.chats = SimpleNamespace(create=self.create_chat)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(
+                embed_content=self.async_embed_content,
+                generate_content=self.async_generate_content,
+            ),
+            chats=SimpleNamespace(create=self.create_async_chat),
+        )
+
+    def call(self, kind, latency):
+        fail, latency = self.draw(kind, latency)
+        time.sleep(latency)
+        self.fail(fail)
+
+    async def async_call(self, kind, latency):
+        fail, latency = self.draw(kind, latency)
+        await asyncio.sleep(latency)
+        self.fail(fail)
+
+    def draw(self, kind, latency):
+        with self.lock:
+            self.calls[kind] += 1
+            if self.quota and self.quota.wait_time(1, time.monotonic()) > 0:
+                self.rejected += 1
+                self.errors += 1
+                return True, 0.0
+            if self.quota:
+                self.quota.take(1)
+            fail = self.rng.random() < self.error_rate
+            self.errors += fail
+        return fail, latency
+
+    @staticmethod
+    def fail(fail):
+        if fail:
+            raise ClientError(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "message": "fake quota",
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+
+    @staticmethod
+    def usage(prompt, output):
+        return SimpleNamespace(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(output) // 4,
+        )
+
+    def embed_content(self, model, contents, config=None):
+        self.call("embed", self.embed_latency)
+        return self.embedding_response(contents)
+
+    async def async_embed_content(self, model, contents, config=None):
+        await self.async_call("embed", self.embed_latency)
+        return self.embedding_response(contents)
+
+    def tts_latency(self, contents):
+        return self.latency + len(contents) * self.tts_seconds_per_char
+
+    def embedding_response(self, contents):
+        texts = [contents] if isinstance(contents, str) else contents
+        return SimpleNamespace(
+            embeddings=[
+                SimpleNamespace(values=self.embedding.vector(text)) for text in texts
+            ]
+        )
+
+    def generate_content(self, model, contents, config=None):
+        self.call("tts", self.tts_latency(contents))
+        return self.speech_response(contents)
+
+    async def async_generate_content(self, model, contents, config=None):
+        await self.async_call("tts", self.tts_latency(contents))
+        return self.speech_response(contents)
+
+    def speech_response(self, contents):
+        # a quiet tone rather than silence, so encoders have something to code
+        samples = len(contents) * self.tts_bytes_per_char // 2
+        audio = (np.sin(np.arange(samples) * 0.06) * 3000).astype("<i2").tobytes()
+        return SimpleNamespace(
+            candidates=[
+                SimpleNamespace(
+                    content=SimpleNamespace(
+                        parts=[SimpleNamespace(inline_data=SimpleNamespace(data=audio))]
+                    )
+                )
+            ],
+            usage_metadata=self.usage(contents, ""),
+        )
+
+    def create_chat(self, model, config=None, history=None):
+        return FakeChat(self, getattr(config, "system_instruction", None) or "")
+
+    def create_async_chat(self, model, config=None, history=None):
+        return FakeAsyncChat(self, getattr(config, "system_instruction", None) or "")
+
+
+class FakeChat:
+    def __init__(self, client, system_instruction):
+        self.client = client
+        self.system_instruction = system_instruction
+
+    def answer(self, query):
+        # a summary is roughly a hundredth of its input
+        prompt = self.system_instruction + query
+        return prompt[-max(200, len(prompt) // 100) :]
+
+    def response(self, query):
+        text = self.answer(query)
+        prompt = self.system_instruction + query
+        return SimpleNamespace(text=text, usage_metadata=self.client.usage(prompt, text))
+
+    def stream_chunks(self, query):
+        # (delay, chunk) per word, spread over four fifths of the latency
+        text = self.answer(query)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            yield self.client.latency * 0.8 / len(words), SimpleNamespace(
+                text=word + ("" if last else " "),
+                usage_metadata=(
+                    self.client.usage(self.system_instruction + query, text)
+                    if last
+                    else None
+                ),
+            )
+
+    def send_message(self, query):
+        self.client.call("chat", self.client.latency)
+        return self.response(query)
+
+    def send_message_stream(self, query):
+        # first token after a fifth of the latency, the rest spread over the answer
+        self.client.call("chat", self.client.latency / 5)
+        for delay, chunk in self.stream_chunks(query):
+            time.sleep(delay)
+            yield chunk
+
+
+class FakeAsyncChat(FakeChat):
+    async def send_message(self, query):
+        await self.client.async_call("chat", self.client.latency)
+        return self.response(query)
+
+    async def send_message_stream(self, query):
+        # awaited for the stream, like the genai async chat
+        await self.client.async_call("chat", self.client.latency / 5)
+        return self.iter_chunks(query)
+
+    async def iter_chunks(self, query):
+        for delay, chunk in self.stream_chunks(query):
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+class FakeYouTubeTranscriptApi:
+    # stands in for YouTubeTranscriptApi, every video has the same fixture as
+    # its tracks, (language code, is generated) pairs, all translatable to
+    # english. listing and fetching a track each take latency
+    def __init__(
+        self, items, latency=0.5, error_rate=0.0, seed=0, tracks=(("en", True),)
+    ):
+        self.items = items
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tracks = tracks
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def request(self, video_id):
+        with self.lock:
+            self.calls += 1
+            fail = self.rng.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError(f"fake: no transcript for {video_id}")
+
+    def fetch(self, video_id, languages=("en",)):
+        self.request(video_id)
+        items = [dict(item) for item in self.items]
+        return SimpleNamespace(to_raw_data=lambda: items)
+
+    def list(self, video_id):
+        self.request(video_id)
+        return [
+            FakeTranscriptTrack(self, video_id, language_code, is_generated)
+            for language_code, is_generated in self.tracks
+        ]
+
+
+class FakeTranscriptTrack:
+    def __init__(self, api, video_id, language_code, is_generated):
+        self.api = api
+        self.video_id = video_id
+        self.language_code = language_code
+        self.is_generated = is_generated
+        self.is_translatable = language_code != "en"
+        self.translation_languages = (
+            [SimpleNamespace(language="English", language_code="en")]
+            if self.is_translatable
+            else []
+        )
+
+    def translate(self, language_code):
+        return FakeTranscriptTrack(
+            self.api, self.video_id, language_code, self.is_generated
+        )
+
+    def fetch(self):
+        return self.api.fetch(self.video_id)
@@ -0,0 +1,107 @@
+import argparse
+import tempfile
+import time
+
+from benchmarks.fakes import (
+    FakeGenaiClient,
+    FakeYouTubeTranscriptApi,
+    synthetic_transcript,
+)
+from utils.Ingestion import ingest_video
+from utils.Registry import ResourceRegistry
+from utils.Transcript import Transcript
+from utils.Workers import WorkerPool, owner_id
+
+
+def fake_gemini_llm(registry, gemini_api_key):
+    gemini_llm = registry.gemini_llm(gemini_api_key)
+    if not isinstance(gemini_llm.llm, FakeGenaiClient):
+        gemini_llm.llm = FakeGenaiClient(
+            latency=0, embed_latency=float(gemini_api_key)
+        )
+    return gemini_llm
+
+
+def indexing_job(registry, job, video_id, groq_api_key, gemini_api_key):
+    # the real ingestion path over fake apis: captions fetch, chunking and
+    # embedding in the worker, the chunks written by the benchmark process
+    fake_gemini_llm(registry, gemini_api_key)
+    transcript = Transcript(
+        FakeYouTubeTranscriptApi(
+            synthetic_transcript(float(groq_api_key) / 60, seed=video_id),
+            latency=float(gemini_api_key),
+        )
+    )
+    result = ingest_video(
+        job, video_id, groq_api_key, gemini_api_key, registry, transcript=transcript
+    )
+    return {"chunk_count": len(result["chunks"])}
+
+
+def searchable(registry, gemini_api_key, job_queue, job_ids):
+    # every chunk a worker embedded is in chroma and found by a vector query
+    vector_store = registry.vector_store(gemini_api_key)
+    found = 0
+    for job_id in job_ids:
+        job = job_queue.get(job_id)
+        if job["status"] != "done":
+            continue
+        stored = vector_store.collection.get(
+            where={"youtube_id": job["video_id"]}, include=["documents"]
+        )["documents"]
+        chunks = vector_store.retrieve_documents(
+            stored[0] if stored else "", job["video_id"], mode="vector"
+        )
+        found += len(stored) == job["result"]["chunk_count"] and bool(chunks)
+    return found
+
+
+def run(n_videos, latency, minutes, workers_list):
+    print(
+        f"{n_videos} videos of {minutes} minutes, api latency={latency}s, "
+        "embeddings written by this process"
+    )
+
+    # the fake keys carry the simulated costs into the worker processes
+    groq_api_key, gemini_api_key = str(minutes), str(latency)
+    for workers in workers_list:
+        data_path = tempfile.mkdtemp()
+        registry = ResourceRegistry(data_path)
+        registry.index_writer()
+        fake_gemini_llm(registry, gemini_api_key)
+        job_queue = registry.job_queue()
+        owner = owner_id(groq_api_key, gemini_api_key)
+        job_ids = [job_queue.enqueue(f"video{i:06d}", owner) for i in range(n_videos)]
+
+        start = time.perf_counter()
+        worker_pool = WorkerPool(
+            groq_api_key,
+            gemini_api_key,
+            data_path,
+            workers=workers,
+            poll_interval=0.1,
+            handler="benchmarks.job_queue_benchmark:indexing_job",
+        ).start()
+        while job_queue.pending(job_ids):
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        worker_pool.stop()
+
+        print(
+            f"workers={workers:<3} {n_videos / elapsed * 60:8.1f} videos/min "
+            f"wall={elapsed:.2f}s statuses={job_queue.counts()} "
+            f"searchable={searchable(registry, gemini_api_key, job_queue, job_ids)}"
+            f"/{n_videos}"
+        )
+        registry.index_writer().stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--minutes", type=float, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    run(args.videos, args.latency, args.minutes, args.workers)
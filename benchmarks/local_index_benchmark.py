@@ -0,0 +1,103 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fakes import FakeEmbedding, synthetic_sentences
+from benchmarks.retrieval_benchmark import percentile
+from DataBases.VectorStore import VectorStore
+
+
+def fill_collection(vector_store, n_videos, chunks_per_video, dimensions, seed=0):
+    # random unit embeddings written straight to chroma, no embedding calls
+    rng = np.random.default_rng(seed)
+    documents = synthetic_sentences(chunks_per_video)
+    batch_size = vector_store.chroma_client.get_max_batch_size()
+    videos_per_batch = max(1, batch_size // chunks_per_video)
+
+    for first in range(0, n_videos, videos_per_batch):
+        videos = range(first, min(n_videos, first + videos_per_batch))
+        embeddings = rng.standard_normal(
+            (len(videos) * chunks_per_video, dimensions), dtype=np.float32
+        )
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        vector_store.collection.add(
+            ids=[f"video{v:06d}-{i}" for v in videos for i in range(chunks_per_video)],
+            documents=documents * len(videos),
+            embeddings=embeddings,
+            metadatas=[
+                {"start": i * 5.0, "youtube_id": f"video{v:06d}"}
+                for v in videos
+                for i in range(chunks_per_video)
+            ],
+        )
+
+
+def measure(vector_store, video_ids, queries, n_results):
+    latencies = []
+    for video_id in video_ids:
+        for query in queries:
+            start = time.perf_counter()
+            vector_store.retrieve_documents(query, video_id, n_results, mode="vector")
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(n_videos, chunks_per_video, dimensions, n_queried, n_results):
+    embedding_function = FakeEmbedding(latency=0, dimensions=dimensions)
+    chroma_store = VectorStore(
+        None, path=tempfile.mkdtemp(), embedding_function=embedding_function
+    )
+    start = time.perf_counter()
+    fill_collection(chroma_store, n_videos, chunks_per_video, dimensions)
+    print(
+        f"{n_videos} videos x {chunks_per_video} chunks, {dimensions} dimensions, "
+        f"stored in {time.perf_counter() - start:.1f}s"
+    )
+
+    local_store = VectorStore(
+        None,
+        embedding_function=embedding_function,
+        chroma_client=chroma_store.chroma_client,
+        local_index=True,
+        max_local_videos=n_queried,
+    )
+    rng = np.random.default_rng(1)
+    video_ids = [
+        f"video{v:06d}" for v in rng.choice(n_videos, n_queried, replace=False)
+    ]
+    queries = synthetic_sentences(20)
+
+    # first query per video misses the local index and loads the matrix
+    start = time.perf_counter()
+    for video_id in video_ids:
+        local_store.load_vector_index(video_id)
+    load_time = (time.perf_counter() - start) / n_queried
+
+    for name, vector_store in [("chroma", chroma_store), ("local", local_store)]:
+        latencies = measure(vector_store, video_ids, queries, n_results)
+        print(
+            f"{name:<7} p50={percentile(latencies, 50) * 1000:7.3f}ms "
+            f"p99={percentile(latencies, 99) * 1000:7.3f}ms "
+            f"queries={len(latencies)}"
+        )
+    print(f"local index load per video={load_time * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=10000)
+    parser.add_argument("--chunks-per-video", type=int, default=20)
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--queried", type=int, default=50)
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    run(
+        args.videos,
+        args.chunks_per_video,
+        args.dimensions,
+        args.queried,
+        args.n_results,
+    )
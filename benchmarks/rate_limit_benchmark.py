@@ -0,0 +1,90 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeGenaiClient
+from benchmarks.retrieval_benchmark import percentile
+from utils.LLM import GeminiLLM
+from utils.RateLimiter import BACKGROUND, INTERACTIVE, RateLimits
+
+
+def run_mode(name, budgets, max_retries, args):
+    # a burst of background summaries against a fake quota, with chat
+    # questions arriving once the quota is used up
+    llm = GeminiLLM(
+        "fake",
+        max_retries=max_retries,
+        backoff=args.backoff,
+        rate_limits=RateLimits(budgets),
+    )
+    llm.llm = FakeGenaiClient(latency=args.latency, quota_per_minute=args.quota)
+    outcomes = {"background": [], "interactive": []}
+    lock = threading.Lock()
+
+    def timed(kind, i, priority):
+        start = time.perf_counter()
+        try:
+            llm.TextLLM(f"{kind} prompt {i}", [], "Summarize", priority=priority)
+        except Exception:
+            latency = None
+        else:
+            latency = time.perf_counter() - start
+        with lock:
+            outcomes[kind].append(latency)
+
+    def ask():
+        time.sleep(args.interactive_delay)
+        threads = []
+        for i in range(args.interactive):
+            threads.append(
+                threading.Thread(target=timed, args=("interactive", i, INTERACTIVE))
+            )
+            threads[-1].start()
+            time.sleep(args.interactive_interval)
+        for thread in threads:
+            thread.join()
+
+    start = time.perf_counter()
+    asker = threading.Thread(target=ask)
+    asker.start()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(
+            executor.map(
+                lambda i: timed("background", i, BACKGROUND), range(args.background)
+            )
+        )
+    background_wall = time.perf_counter() - start
+    asker.join()
+
+    interactive = [
+        latency for latency in outcomes["interactive"] if latency is not None
+    ] or [0.0]
+    failed = sum(latency is None for kind in outcomes.values() for latency in kind)
+    print(
+        f"{name:<12} background={background_wall:6.1f}s "
+        f"interactive p50={percentile(interactive, 50) * 1000:7.0f}ms "
+        f"p95={percentile(interactive, 95) * 1000:7.0f}ms "
+        f"failed={failed:<4} 429s={llm.llm.rejected}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quota", type=int, default=600, help="requests per minute")
+    parser.add_argument("--background", type=int, default=700)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--interactive", type=int, default=10)
+    parser.add_argument("--interactive-delay", type=float, default=3.0)
+    parser.add_argument("--interactive-interval", type=float, default=0.5)
+    parser.add_argument("--backoff", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(
+        f"quota {args.quota}/min, {args.background} background calls on "
+        f"{args.threads} threads, {args.interactive} chat questions"
+    )
+    run_mode("no retries", "", 0, args)
+    run_mode("retries", "", 5, args)
+    run_mode("budgeted", f"gemini/*={args.quota}", 5, args)
@@ -0,0 +1,117 @@
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fakes import BagOfWordsEmbedding
+from DataBases.VectorStore import VectorStore
+
+TOPICS = {
+    "mining": "nodule cobalt manganese dredge seabed collector tailings plume",
+    "biology": "octopus sponge coral larvae species habitat predator bacteria",
+    "physics": "pressure sonar temperature density current salinity acoustic wave",
+    "robotics": "rover thruster tether manipulator battery camera sensor hull",
+}
+FILLER = "the we this that then so and a of in it is was really very".split()
+NAMES = "Okafor Lindqvist Tanaka Moreau Alvarez Kowalski Haddad Nakamura".split()
+
+
+def fixture_transcript(n_chunks, n_facts, seed=0):
+    # topical chunks of filler and topic words, some carry a named figure
+    rng = random.Random(seed)
+    chunks, topics, facts = [], [], []
+    fact_chunks = set(rng.sample(range(n_chunks), n_facts))
+    for index in range(n_chunks):
+        topic = rng.choice(list(TOPICS))
+        words = [
+            rng.choice(TOPICS[topic].split() if rng.random() < 0.4 else FILLER)
+            for _ in range(rng.randint(60, 90))
+        ]
+        if index in fact_chunks:
+            name = f"{rng.choice(NAMES)}{len(facts)}"
+            number = rng.randint(1000, 9999)
+            words[rng.randrange(len(words)) :] += [name, "measured", str(number)]
+            facts.append((f"What did {name} measure?", index))
+        chunks.append(" ".join(words) + ".")
+        topics.append(topic)
+
+    queries = facts + [
+        (
+            " ".join(TOPICS[topic].split()[:3]),
+            [i for i, t in enumerate(topics) if t == topic],
+        )
+        for topic in TOPICS
+    ]
+    return chunks, queries
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def evaluate(vector_store, chunks, queries, mode, n_results):
+    latencies, fact_hits, facts, topic_precision = [], 0, 0, []
+    starts = {float(index): index for index in range(len(chunks))}
+    for query, relevant in queries:
+        start = time.perf_counter()
+        results = vector_store.retrieve_documents(
+            query, "benchmark01", n_results=n_results, mode=mode
+        )
+        latencies.append(time.perf_counter() - start)
+
+        found = [starts[float(result["start"])] for result in results]
+        if isinstance(relevant, int):
+            facts += 1
+            fact_hits += relevant in found
+        else:
+            topic_precision.append(
+                sum(index in relevant for index in found) / n_results
+            )
+
+    print(
+        f"{mode:<8} p50={percentile(latencies, 50) * 1000:7.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:7.1f}ms "
+        f"exact_term_recall@{n_results}={fact_hits / facts:.2f} "
+        f"topic_precision@{n_results}={statistics.mean(topic_precision):.2f}"
+    )
+
+
+def run(n_chunks, n_facts, latency, n_results):
+    chunks, queries = fixture_transcript(n_chunks, n_facts)
+    embedding_function = BagOfWordsEmbedding(latency=0)
+    vector_store = VectorStore(
+        None,
+        path=tempfile.mkdtemp(),
+        embedding_function=embedding_function,
+        vector_timeout=max(1.0, 10 * latency),
+    )
+    vector_store.add_documents(
+        chunks, [float(i) for i in range(n_chunks)], "benchmark01"
+    )
+    print(
+        f"{n_chunks} chunks, {n_facts} exact-term and {len(TOPICS)} topic queries, "
+        f"embedding latency={latency}s"
+    )
+
+    # ingestion built the bm25 index, queries pay the embedding latency
+    embedding_function.latency = latency
+    for mode in ["vector", "lexical", "hybrid"]:
+        evaluate(vector_store, chunks, queries, mode, n_results)
+
+    # a rate limited embedding api, hybrid drops to the lexical index
+    embedding_function.error = RuntimeError("429 RESOURCE_EXHAUSTED")
+    print("embedding api failing:")
+    evaluate(vector_store, chunks, queries, "hybrid", n_results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--facts", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.chunks, args.facts, args.latency, args.n_results)
@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from benchmarks.fakes import FakeGeminiLLM, synthetic_sentences
+from utils.Summarizer import Summarizer
+
+
+def run(n_sentences, latency, workers_list, max_chars):
+    transcript_text_list = synthetic_sentences(n_sentences)
+    total_chars = len(" ".join(transcript_text_list))
+    print(
+        f"transcript: {total_chars:,} chars, max_chars={max_chars:,}, latency={latency}s"
+    )
+
+    for max_workers in workers_list:
+        llm = FakeGeminiLLM(latency=latency)
+        summarizer = Summarizer(None, max_workers=max_workers, llm=llm)
+
+        start = time.perf_counter()
+        summarizer.summarize_transcript(transcript_text_list, max_chars=max_chars)
+        elapsed = time.perf_counter() - start
+
+        print(f"workers={max_workers:<3} calls={llm.calls:<4} wall={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-chars", type=int, default=100_000)
+    args = parser.parse_args()
+
+    run(args.sentences, args.latency, args.workers, args.max_chars)
@@ -0,0 +1,47 @@
+import argparse
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmbedding, synthetic_sentences
+from DataBases.VectorStore import VectorStore
+
+
+def run(n_chunks, latency, batch_size, workers_list):
+    documents = synthetic_sentences(n_chunks)
+    timestamps = [i * 5.0 for i in range(n_chunks)]
+    print(f"{n_chunks} chunks, batch_size={batch_size}, embedding latency={latency}s")
+
+    for max_workers in workers_list:
+        embedding_function = FakeEmbedding(latency=latency)
+        vector_store = VectorStore(
+            None,
+            path=tempfile.mkdtemp(),
+            embedding_function=embedding_function,
+            batch_size=batch_size,
+            max_workers=max_workers,
+        )
+
+        start = time.perf_counter()
+        vector_store.add_documents(documents, timestamps, "benchmark01")
+        elapsed = time.perf_counter() - start
+
+        # same video again, upserts must not create duplicates
+        vector_store.add_documents(documents, timestamps, "benchmark01")
+        stored = vector_store.collection.count()
+
+        print(
+            f"workers={max_workers:<3} {n_chunks / elapsed:8.1f} chunks/s "
+            f"wall={elapsed:.2f}s embed_calls={embedding_function.calls} "
+            f"embedded_texts={embedding_function.texts} stored={stored}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    run(args.chunks, args.latency, args.batch_size, args.workers)
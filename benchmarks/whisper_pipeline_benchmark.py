@@ -0,0 +1,92 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.audio_segmentation_benchmark import generate_audio
+from benchmarks.fakes import FakeGroqClient, local_chunks
+from utils.AudioDownloader import AudioDownloader
+from utils.LLM import GroqLLM
+from utils.Transcript import Transcript
+
+
+class LocalAudioDownloader(AudioDownloader):
+    # stands in for pytubefix, "downloads" a local file at a fixed rate
+    def __init__(self, audio_path, bytes_per_second, **kwargs):
+        super().__init__(**kwargs)
+        self.audio_path = audio_path
+        self.bytes_per_second = bytes_per_second
+
+    def iter_audio_segments(self, video_id, bitrate=128_000):
+        segment_time = self.max_segment_bytes * 0.9 * 8 / bitrate
+        yield from self.segment_stream(
+            local_chunks(self.audio_path, bytes_per_second=self.bytes_per_second),
+            segment_time,
+        )
+
+
+def make_llm(latency, max_workers):
+    llm = GroqLLM("fake", max_workers=max_workers)
+    llm.llm = FakeGroqClient(latency=latency)
+    return llm
+
+
+def run(duration, download_mbps, latency, max_workers, max_segment_mb):
+    audio_path = os.path.join(tempfile.mkdtemp(), "synthetic.m4a")
+    # fragmented like YouTube's DASH audio, so ffmpeg can cut it from a pipe
+    generate_audio(audio_path, duration, movflags="+frag_keyframe+empty_moov")
+    bytes_per_second = download_mbps * 1024**2
+    max_segment_bytes = int(max_segment_mb * 1024**2)
+    print(
+        f"audio: {os.path.getsize(audio_path) / 1024**2:.1f} MB, "
+        f"download {download_mbps} MB/s, transcription latency {latency}s"
+    )
+
+    # download and split everything first, then transcribe
+    start = time.perf_counter()
+    segments = list(
+        LocalAudioDownloader(
+            audio_path, bytes_per_second, max_segment_bytes=max_segment_bytes
+        ).iter_audio_segments("local")
+    )
+    paths, start_times = zip(*segments)
+    make_llm(latency, max_workers).AudioLLM(list(paths), start_times=list(start_times))
+    sequential = time.perf_counter() - start
+    print(f"download then transcribe: {sequential:.2f}s ({len(segments)} segments)")
+
+    # overlapped pipeline
+    start = time.perf_counter()
+    first_part = None
+    for transcript_part in Transcript().with_whisper_stream(
+        "fake",
+        "local",
+        audio_downloader=LocalAudioDownloader(
+            audio_path, bytes_per_second, max_segment_bytes=max_segment_bytes
+        ),
+        llm=make_llm(latency, max_workers),
+    ):
+        first_part = first_part or time.perf_counter() - start
+    overlapped = time.perf_counter() - start
+    print(
+        f"overlapped pipeline:      {overlapped:.2f}s (first part after {first_part:.2f}s)"
+    )
+
+    os.remove(audio_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=1800)
+    parser.add_argument("--download-mbps", type=float, default=4.0)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-segment-mb", type=float, default=4)
+    args = parser.parse_args()
+
+    run(
+        args.duration,
+        args.download_mbps,
+        args.latency,
+        args.workers,
+        args.max_segment_mb,
+    )
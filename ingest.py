@@ -0,0 +1,101 @@
+__import__("pysqlite3")
+import sys
+import os
+import argparse
+import time
+from dotenv import load_dotenv
+
+sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+
+from pytubefix import Playlist
+from utils.Registry import ResourceRegistry
+from utils.Workers import WorkerPool, owner_id
+from utils.Ingestion import is_indexed
+from utils.HelperFunctions import get_video_id
+
+
+def expand_urls(urls):
+    # playlists are expanded into their videos, duplicates are dropped
+    video_ids = []
+    for url in urls:
+        if "list=" in url and "v=" not in url:
+            video_ids.extend(get_video_id(video_url) for video_url in Playlist(url))
+        else:
+            video_ids.append(get_video_id(url))
+    return [video_id for video_id in dict.fromkeys(video_ids) if video_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Batch ingest YouTube videos or playlists into the vector db"
+    )
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("--file", help="text file with one url per line")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--data-path", default="/DataBases")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    args = parser.parse_args()
+
+    load_dotenv()
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not (groq_api_key and gemini_api_key):
+        parser.error("GROQ_API_KEY and GEMINI_API_KEY must be set")
+
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file) as file:
+            urls.extend(line.strip() for line in file if line.strip())
+    video_ids = expand_urls(urls)
+    if not video_ids:
+        parser.error("no video urls given")
+
+    registry = ResourceRegistry(args.data_path)
+    try:
+        # workers queue what they embed for the one process owning the chroma db,
+        # this one unless the app is running
+        registry.index_writer()
+    except RuntimeError as error:
+        print(f"{error}, it writes the ingested chunks")
+    else:
+        # videos indexed before the manifest are only visible from here
+        vector_store = registry.vector_store(gemini_api_key)
+        for video_id in video_ids:
+            is_indexed(registry, video_id, vector_store)
+
+    job_queue = registry.job_queue()
+    owner = owner_id(groq_api_key, gemini_api_key)
+    job_ids = {job_queue.enqueue(video_id, owner): video_id for video_id in video_ids}
+    print(f"queued {len(job_ids)} videos, {args.workers} workers")
+
+    start = time.perf_counter()
+    worker_pool = WorkerPool(
+        groq_api_key, gemini_api_key, args.data_path, workers=args.workers
+    ).start()
+    try:
+        pending = set(job_ids)
+        while pending:
+            time.sleep(args.poll_interval)
+            still_pending = set(job_queue.pending(pending))
+            for job_id in pending - still_pending:
+                job = job_queue.get(job_id)
+                print(f"{job['video_id']}: {job['status']} {job['error'] or ''}")
+            pending = still_pending
+            # replaces workers that crashed
+            worker_pool.start()
+    finally:
+        worker_pool.stop()
+
+    elapsed = time.perf_counter() - start
+    failed = [
+        job_id for job_id in job_ids if job_queue.get(job_id)["status"] == "failed"
+    ]
+    print(
+        f"{len(job_ids) - len(failed)}/{len(job_ids)} videos ingested in "
+        f"{elapsed:.0f}s ({len(job_ids) / elapsed * 60:.1f} videos/min)"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
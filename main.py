@@ -1,25 +1,142 @@
 __import__("pysqlite3")
 import sys
 import os
+import time
 from dotenv import load_dotenv
 
-
 sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
 
 import streamlit as st
 from utils.Transcript import Transcript
-from DataBases.VectorStore import VectorStore
-from utils.LLM import GeminiLLM
-from utils.Summarizer import Summarizer
+from utils.Registry import ResourceRegistry
+from utils.Workers import WorkerPool, owner_id
+from utils.Ingestion import is_indexed
+from utils.ChatContext import ChatHistory, format_chunks
+from utils.Metrics import METRICS
+from utils.RateLimiter import INTERACTIVE, is_rate_limited
+from DataBases.JobQueue import ACTIVE
 from utils.HelperFunctions import (
-    create_chunks_with_timestamps,
+    AUDIO_MIME_TYPES,
+    encode_audio,
     get_video_id,
-    wave_bytesio,
+    pcm_seconds,
 )
 
 transcript = Transcript()
 
 
+@st.cache_resource
+def get_registry():
+    # one chroma client, one set of caches and pooled api clients for the whole process;
+    # the only process writing to chroma, ingestion workers queue their batches
+    registry = ResourceRegistry("/DataBases")
+    registry.index_writer()
+    return registry
+
+
+@st.cache_resource
+def get_metrics_server():
+    # prometheus text on http://host:METRICS_PORT/metrics, one server per process
+    port = os.getenv("METRICS_PORT")
+    return METRICS.serve(int(port)) if port else None
+
+
+try:
+    registry = get_registry()
+except RuntimeError as error:
+    # a batch ingestion run owns the vector db
+    st.error(f"{error}, try again once it has finished")
+    st.stop()
+get_metrics_server()
+artifact_store = registry.artifact_store()
+job_coordinator = registry.job_coordinator()
+job_queue = registry.job_queue()
+answer_cache = registry.answer_cache()
+
+
+@st.fragment(run_every=2)
+def indexing_progress():
+    job = job_queue.get(st.session_state.job_id)
+    if job["status"] not in ACTIVE:
+        st.rerun()
+    st.caption(f"Indexing in the background... {job['messages'][-1]}")
+
+
+def show_timings(job):
+    # per stage seconds and counters the worker measured for this job
+    if st.session_state.get("show_timings") and (job["result"] or {}).get("metrics"):
+        st.json(job["result"]["metrics"], expanded=False)
+
+
+def synthesize_summary_audio(gemini_llm, summary, video_id, parts):
+    # off the script thread, parts fill in as they are synthesized; the whole
+    # summary is encoded once, for the player and the artifact store
+    for part in gemini_llm.TTSStream(summary):
+        parts.append(part)
+    audio, audio_format = encode_audio(b"".join(parts))
+    artifact_store.save(video_id, audio=audio, audio_format=audio_format)
+    return audio, audio_format
+
+
+def summary_audio_player():
+    # drawn on every run once synthesis has started; a fragment polls while it
+    # runs, the finished audio is drawn without one so the polling stops
+    audio = st.session_state.summary_audio
+    if audio["job"].done and (
+        time.monotonic() - audio["started"] >= audio["first_seconds"]
+    ):
+        show_summary_audio(audio)
+    else:
+        summary_audio_stream()
+
+
+def show_summary_audio(audio):
+    # the whole summary, from where the first part ended
+    try:
+        summary_audio, audio_format = audio["job"].wait()
+    except Exception as error:
+        # rate limited calls were already retried with backoff
+        if is_rate_limited(error):
+            st.warning("The Gemini API limit was reached, try again later")
+        else:
+            st.warning(f"Could not generate the audio: {error}")
+        return
+    st.audio(
+        summary_audio,
+        format=AUDIO_MIME_TYPES[audio_format],
+        start_time=audio["first_seconds"],
+        autoplay=True,
+    )
+
+
+@st.fragment(run_every=0.5)
+def summary_audio_stream():
+    # the first, short part plays while the rest is synthesized; the page
+    # reruns once it has played and the whole summary is encoded
+    audio = st.session_state.summary_audio
+    job = audio["job"]
+    if audio["first_part"] is None and audio["parts"] and not job.done:
+        first_part = audio["parts"][0]
+        audio["first_part"] = encode_audio(first_part)
+        audio["first_seconds"] = pcm_seconds(first_part)
+        audio["started"] = time.monotonic()
+
+    if job.done and time.monotonic() - audio["started"] >= audio["first_seconds"]:
+        st.rerun()
+    elif audio["first_part"] is not None:
+        first_audio, audio_format = audio["first_part"]
+        st.audio(first_audio, format=AUDIO_MIME_TYPES[audio_format], autoplay=True)
+    else:
+        st.caption("Generating audio...")
+
+
+def run_once(key, function):
+    # single flight across sessions, concurrent callers share one result;
+    # function runs on another thread, so it must not touch st.session_state
+    job, _ = job_coordinator.submit(key, lambda job: function())
+    return job.wait()
+
+
 st.title("YouTube QnA")
 
 with st.sidebar:
@@ -31,6 +148,7 @@ with st.sidebar:
         "Gemini API Key", key="gemini_api_key", type="password"
     )
 
+    st.checkbox("Show timings", key="show_timings")
     video_process_button = st.button("Process")
     if video_process_button:
         if video_url and groq_api_key and gemini_api_key:
@@ -48,133 +166,251 @@ with st.sidebar:
                     st.write("Video ID extracted successfully")
 
                     if "vector_store" not in st.session_state:
-                        st.session_state.vector_store = VectorStore(gemini_api_key)
-
-                    # check if transcript already exist
-                    if (
-                        len(
-                            st.session_state.vector_store.collection.get(
-                                where={"youtube_id": video_id}
-                            )["ids"]
+                        st.session_state.vector_store = registry.vector_store(
+                            gemini_api_key
                         )
-                        > 0
-                    ):
-                        st.write("Transcript already exist in vector db")
 
-                    else:
-                        st.write("Downloading transcript...")
-
-                        transcript_list = []
-                        # transcript with youtube api
-                        try:
-                            transcript_list = transcript.with_youtube_api(video_id)
-                            st.write("Transcript successfully with YouTube API")
-                        except:
-                            st.write("Oops YouTube API failed, trying with Whisper")
-                            transcript_list = transcript.with_whisper(
-                                groq_api_key, video_id
-                            )
-                            st.write("Transcript successfully with Whisper")
-
-                        if not transcript_list:
-                            st.error(
-                                "Transcript failed, Could you try with a different video?"
-                            )
-                        else:
-                            # create chunks
-                            chunks, timestamps = create_chunks_with_timestamps(
-                                transcript_list
-                            )
-                            st.write("Chunks created successfully")
+                    # ingestion runs in worker processes, the first session to
+                    # ask for a video queues it and later sessions follow that job
+                    worker_pool = registry.get_or_create(
+                        "worker_pool",
+                        owner_id(groq_api_key, gemini_api_key),
+                        lambda: WorkerPool(
+                            groq_api_key,
+                            gemini_api_key,
+                            workers=int(os.getenv("INGEST_WORKERS", 2)),
+                        ),
+                    ).start()
+                    # videos indexed before the manifest are only visible from
+                    # here, workers don't open the chroma db
+                    is_indexed(registry, video_id, st.session_state.vector_store)
+                    job_id = job_queue.enqueue(
+                        video_id, owner_id(groq_api_key, gemini_api_key)
+                    )
 
-                            # store in vector db
-                            st.session_state.vector_store.add_documents(
-                                chunks, timestamps, video_id
-                            )
+                    seen = 0
+                    while True:
+                        job = job_queue.get(job_id)
+                        for message in job["messages"][seen:]:
+                            st.write(message)
+                        seen = len(job["messages"])
+                        if job["ready"] or job["status"] not in ACTIVE:
+                            break
+                        # workers exit when idle and other key pairs' pools may
+                        # hold every slot, start one as soon as there is room
+                        worker_pool.start()
+                        time.sleep(0.5)
 
-                            if "chunks_for_summarization" not in st.session_state:
-                                st.session_state.chunks_for_summarization = chunks
-                            st.write("Documents added to vector db successfully")
+                    if job["status"] == "failed":
+                        st.error(f"Processing failed: {job['error']}")
+                    elif job["status"] in ACTIVE:
+                        st.session_state.job_id = job_id
+                        st.write("Indexing the rest in the background")
+                    else:
+                        show_timings(job)
                 status.update(
                     label="Processing complete!", state="complete", expanded=False
                 )
         else:
             st.error("All fields are required")
 
+    with st.expander("Server resources"):
+        st.json(registry.stats())
+
 
 if video_url and groq_api_key and gemini_api_key:
 
-    gemini_llm = GeminiLLM(gemini_api_key)
-    if "summary" not in st.session_state:
-        summarizer = Summarizer(gemini_api_key)
-        if ("chunks_for_summarization" not in st.session_state) & (
-            "vector_store" in st.session_state
-        ):
-            chunks_for_summarization = st.session_state.vector_store.collection.get(
-                where={"youtube_id": st.session_state.video_id},
-                include=["documents"],
-            )["documents"]
-            st.session_state.chunks_for_summarization = chunks_for_summarization
+    gemini_llm = registry.gemini_llm(gemini_api_key)
+
+    if "job_id" in st.session_state:
+        job = job_queue.get(st.session_state.job_id)
+        if job["status"] in ACTIVE:
+            indexing_progress()
+
+        else:
+            del st.session_state.job_id
+            if job["status"] == "failed":
+                st.warning(f"Indexing stopped early: {job['error']}")
+            else:
+                show_timings(job)
+
+    if (
+        "summary" not in st.session_state
+        and "video_id" in st.session_state
+        and "job_id" not in st.session_state
+    ):
+        summarizer = registry.summarizer(gemini_api_key)
+        artifacts = artifact_store.get(st.session_state.video_id)
+
+        if "chunks_for_summarization" not in st.session_state:
+            if artifacts and artifacts.chunks:
+                st.session_state.chunks_for_summarization = artifacts.chunks
+            elif "vector_store" in st.session_state:
+                chunks_for_summarization = st.session_state.vector_store.collection.get(
+                    where={"youtube_id": st.session_state.video_id},
+                    include=["documents"],
+                )["documents"]
+                st.session_state.chunks_for_summarization = chunks_for_summarization
 
         if "chunks_for_summarization" in st.session_state:
             with st.spinner("Summarizing..."):
-                st.session_state.summary = summarizer.summarize_transcript(
-                    st.session_state.chunks_for_summarization
-                )
-                st.success(st.session_state.summary)
-            with st.spinner("Generating Audio..."):
-                try:
-                    st.audio(
-                        wave_bytesio(gemini_llm.TTS(st.session_state.summary)),
-                        autoplay=True,
+                if artifacts and artifacts.summary:
+                    st.session_state.summary = artifacts.summary
+                else:
+                    chunks_for_summarization = st.session_state.chunks_for_summarization
+                    st.session_state.summary = run_once(
+                        f"summary:{st.session_state.video_id}",
+                        lambda: summarizer.summarize_transcript(
+                            chunks_for_summarization
+                        ),
                     )
-                except:
-                    st.warning("You might have exceeded the Gemini API limit")
+                    artifact_store.save(
+                        st.session_state.video_id,
+                        chunks=st.session_state.chunks_for_summarization,
+                        summary=st.session_state.summary,
+                    )
+                st.success(st.session_state.summary)
+            if artifacts and artifacts.audio:
+                st.audio(
+                    artifacts.audio,
+                    format=AUDIO_MIME_TYPES.get(artifacts.audio_format, "audio/wav"),
+                    autoplay=True,
+                )
+            else:
+                # sessions asking for the same video share one synthesis,
+                # only the one running it gets the first part early
+                parts = []
+                summary, video_id = st.session_state.summary, st.session_state.video_id
+                job, _ = job_coordinator.submit(
+                    f"audio:{video_id}",
+                    lambda job: synthesize_summary_audio(
+                        gemini_llm, summary, video_id, parts
+                    ),
+                )
+                st.session_state.summary_audio = {
+                    "job": job,
+                    "parts": parts,
+                    "first_part": None,
+                    "first_seconds": 0.0,
+                    "started": 0.0,
+                }
+
+    if "summary_audio" in st.session_state:
+        summary_audio_player()
 
     # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = ChatHistory(gemini_llm)
+    chat_history = st.session_state.chat_history
 
     # Display chat messages from history on app rerun
-    for message in st.session_state.messages:
+    for message in chat_history.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["parts"][0]["text"])
 
     # Accept user input
-    if prompt := st.chat_input("What is up?"):
+    # enabled as soon as the first batch of the video is searchable
+    if prompt := st.chat_input(
+        "What is up?", disabled="vector_store" not in st.session_state
+    ):
 
         # Display user message in chat message container
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # create system_instruction
-        realted_chunks = st.session_state.vector_store.retrieve_documents(
-            prompt, st.session_state.video_id
+        # the first question of a conversation doesn't depend on earlier turns,
+        # its answer is shared once the whole video is indexed
+        cacheable = (
+            not chat_history.messages
+            and not chat_history.summary
+            and "job_id" not in st.session_state
         )
-        system_instruction = f"""
+        question_embedding = None
+        cached_answer = None
+        if cacheable:
+            if st.session_state.vector_store.vector_available():
+                try:
+                    # the embedding cache hands the same vector to retrieval
+                    question_embedding = gemini_llm.embed_query([prompt])[0]
+                except Exception:
+                    pass
+            cached_answer = answer_cache.get(
+                st.session_state.video_id, prompt, question_embedding
+            )
+
+        if cached_answer is not None:
+            # citations are part of the answer text
+            response = cached_answer
+            with st.chat_message("model", avatar="🤖"):
+                st.markdown(response)
+                st.caption("Answered from earlier questions about this video")
+
+        else:
+            started = time.perf_counter()
+
+            # create system_instruction
+            realted_chunks = st.session_state.vector_store.retrieve_documents(
+                prompt, st.session_state.video_id, n_results=8
+            )
+            conversation_summary = (
+                f"Earlier in this conversation:\n{chat_history.summary}\n"
+                if chat_history.summary
+                else ""
+            )
+            system_instruction = f"""
 Instructions:
 - Be helpful and answer questions concisely. If you don't know the answer, say 'I don't know'
 - Utilize the context provided for accurate and specific information.
 - Incorporate your preexisting knowledge to enhance the depth and relevance of your response.
-- Cite your sources(here it it "start" time, where the chunk was played). Cites most be in markdown hyperlink format: [start](https://www.youtube.com/watch?v={st.session_state.video_id}&t=start) 
-Context:
-{realted_chunks}
-        """
-
-        # Display assistant response in chat message container
-        with st.chat_message("model", avatar="🤖"):
-
-            with st.spinner("Thinking..."):
-                response = gemini_llm.TextLLM(
-                    system_instruction=system_instruction,
-                    history=st.session_state.messages,
-                    query=prompt,
+- Cite your sources(here it it "start" time in seconds, shown in brackets before each passage). Cites most be in markdown hyperlink format: [start](https://www.youtube.com/watch?v={st.session_state.video_id}&t=start) 
+{conversation_summary}Context:
+{format_chunks(realted_chunks)}
+            """
+            prompt_size = chat_history.record_prompt(system_instruction, prompt)
+
+            # Display assistant response in chat message container
+            with st.chat_message("model", avatar="🤖"):
+
+                response_placeholder = st.empty()
+                try:
+                    with response_placeholder:
+                        response = st.write_stream(
+                            gemini_llm.TextLLMStream(
+                                system_instruction=system_instruction,
+                                history=chat_history.window(),
+                                query=prompt,
+                            )
+                        )
+                except:
+                    # fall back to the blocking call, replacing any partial stream
+                    with st.spinner("Thinking..."):
+                        response = gemini_llm.TextLLM(
+                            system_instruction=system_instruction,
+                            history=chat_history.window(),
+                            query=prompt,
+                            priority=INTERACTIVE,
+                        )
+                    response_placeholder.markdown(response)
+                st.caption(
+                    f"Prompt ~{prompt_size['prompt_tokens']} tokens "
+                    f"(~{prompt_size['full_history_tokens']} with the full history)"
+                )
+
+            if cacheable:
+                answer_cache.set(
+                    st.session_state.video_id,
+                    prompt,
+                    response,
+                    time.perf_counter() - started,
+                    question_embedding,
                 )
-            st.markdown(response)
 
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "parts": [{"text": prompt}]})
+        chat_history.append("user", prompt)
         # Add assistant response to chat history
-        st.session_state.messages.append(
-            {"role": "model", "parts": [{"text": response}]}
-        )
+        chat_history.append("model", response)
+        # older turns are folded into the summary once the window is full
+        try:
+            chat_history.compact()
+        except:
+            st.warning("Could not summarize the older messages")
@@ -1,54 +1,133 @@
 from pytubefix import YouTube
 import tempfile
 import os
-from pydub import AudioSegment
-import numpy as np
+import csv
+import shutil
+import subprocess
+import threading
+import time
+
+from .Metrics import METRICS
 
 
 class AudioDownloader:
-    def __init__(self):
-        pass
+    def __init__(self, max_segment_bytes=15 * 1024**2):
+        self.max_segment_bytes = max_segment_bytes
+
+    @staticmethod
+    def claim_segment(path):
+        # moves a finished segment out of ffmpeg's directory into a temp file
+        # of its own, the transcriber deletes it once it is done with it
+        handle, claimed_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+        os.close(handle)
+        os.replace(path, claimed_path)
+        return claimed_path
 
-    def download_audio(self, video_id):
+    def iter_audio_segments(self, video_id, bitrate=128_000):
+        # yields (path, start time) while the rest of the audio is still downloading
         self.video_id = video_id
         self.url = "https://www.youtube.com/watch?v=" + self.video_id
         self.yt = YouTube(self.url)
-        self.audio_stream = self.yt.streams.filter(only_audio=True, abr="128kbps")
+        self.audio_stream = self.yt.streams.filter(
+            only_audio=True, abr="128kbps"
+        ).first()
 
-        with tempfile.NamedTemporaryFile(
-            suffix=".m4a", delete=False
-        ) as self.temp_audio:
+        segment_time = self.max_segment_bytes * 0.9 * 8 / bitrate
+        yield from self.segment_stream(self.audio_stream.iter_chunks(), segment_time)
 
-            self.audio_directory = self.temp_audio.name.split("/")
-            self.audio_stream.first().download(
-                filename=self.audio_directory[-1],
-                output_path="/" + self.audio_directory[1],
+    def segment_stream(
+        self, chunks, segment_time, poll_interval=0.2, join_timeout=5.0
+    ):
+        # on an error or when the consumer stops early, ffmpeg is killed, the
+        # feeder stops and the segments not yet yielded are deleted
+        output_directory = tempfile.mkdtemp()
+        segment_list = os.path.join(output_directory, "segments.csv")
+        stopped = threading.Event()
+        process = feeder = None
+        try:
+            process = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-hide_banner",
+                    "-loglevel",
+                    "error",
+                    "-i",
+                    "pipe:0",
+                    "-map",
+                    "0:a",
+                    "-c",
+                    "copy",
+                    "-f",
+                    "segment",
+                    "-segment_time",
+                    f"{segment_time:.3f}",
+                    "-reset_timestamps",
+                    "1",
+                    "-segment_list",
+                    segment_list,
+                    "-segment_list_type",
+                    "csv",
+                    os.path.join(output_directory, "segment%04d.m4a"),
+                ],
+                stdin=subprocess.PIPE,
+                stderr=subprocess.PIPE,
             )
 
-            if os.path.getsize(self.temp_audio.name) > (15 * 1024**2):
-                self.audio = AudioSegment.from_file(self.temp_audio.name)
-                self.temp_audio_paths = []
-                self.no_of_required_chunks = int(
-                    np.ceil(os.path.getsize(self.temp_audio.name) / (15 * 1024**2))
-                )
-                self.segments = np.linspace(
-                    0, len(self.audio) + 1, self.no_of_required_chunks + 1
-                )
+            feed_errors = []
 
-                for start_pt, end_pt in zip(self.segments[:-1], self.segments[1:]):
-                    with tempfile.NamedTemporaryFile(
-                        suffix=".mp3", delete=False
-                    ) as self.temp_audio_chunk:
-                        self.audio[start_pt:end_pt].export(
-                            self.temp_audio_chunk.name, format="mp3"
-                        )
-                        self.temp_audio_paths.append(self.temp_audio_chunk.name)
+            def feed():
+                try:
+                    # time waiting on the download, not writing to ffmpeg
+                    for chunk in METRICS.timed_iter("audio_download", chunks):
+                        if stopped.is_set():
+                            break
+                        METRICS.count("audio_bytes", len(chunk), stage="download")
+                        process.stdin.write(chunk)
+                except Exception as error:
+                    feed_errors.append(error)
+                finally:
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
 
-                        self.temp_audio_chunk.flush()
-                return self.temp_audio_paths
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
 
-            else:
-                self.temp_audio.flush()
-                return [self.temp_audio.name]
+            # ffmpeg appends a line to the segment list when a segment is closed
+            yielded = 0
+            while True:
+                finished = process.poll() is not None
+                if os.path.exists(segment_list):
+                    with open(segment_list, newline="") as file:
+                        lines = [
+                            line for line in file.readlines() if line.endswith("\n")
+                        ]
+                    for filename, start, end in csv.reader(lines[yielded:]):
+                        yielded += 1
+                        yield self.claim_segment(
+                            os.path.join(output_directory, filename)
+                        ), float(start)
+                if finished:
+                    break
+                time.sleep(poll_interval)
 
-        # fix timestamps for multiple audio chunks
+            feeder.join()
+            stderr = process.stderr.read().decode(errors="replace")
+            if feed_errors:
+                raise feed_errors[0]
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    process.returncode, "ffmpeg", stderr=stderr
+                )
+        finally:
+            stopped.set()
+            if process is not None:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+                process.stderr.close()
+            if feeder is not None:
+                # a feeder blocked on the download notices at its next chunk
+                feeder.join(join_timeout)
+            shutil.rmtree(output_directory, ignore_errors=True)
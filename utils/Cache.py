@@ -0,0 +1,422 @@
+from collections import OrderedDict
+import hashlib
+import json
+import numpy as np
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+from .Metrics import METRICS
+
+MISSING = object()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path=None,
+        max_memory_items=512,
+        max_memory_bytes=64 * 1024**2,
+        max_memory_item_bytes=1024**2,
+        max_disk_bytes=512 * 1024**2,
+        ttl=7 * 24 * 3600,
+    ):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_memory_item_bytes = max_memory_item_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self.db = None
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                "expires_at REAL, accessed_at REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses(accessed_at)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def make_key(*parts):
+        # content address: the same model, instruction, history and query give the same key
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            if key in self.memory:
+                expires_at, value, _ = self.memory[key]
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    METRICS.count("cache_lookups", cache="response", result="memory_hit")
+                    return value
+                self._forget(key)
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self.db.execute(
+                        "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                    )
+                    self.db.commit()
+                    value = pickle.loads(row[0])
+                    self._remember(key, row[1], value, len(row[0]))
+                    self.counters["disk_hits"] += 1
+                    METRICS.count("cache_lookups", cache="response", result="disk_hit")
+                    return value
+                if row:
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.db.commit()
+
+            self.counters["misses"] += 1
+            METRICS.count("cache_lookups", cache="response", result="miss")
+            return MISSING
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self._remember(key, expires_at, value, len(blob))
+
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, len(blob), expires_at, now),
+                )
+                self._evict_disk(now)
+                self.db.commit()
+
+    def get_or_call(self, key, function):
+        value = self.get(key)
+        if value is MISSING:
+            value = function()
+            self.set(key, value)
+        return value
+
+    def _remember(self, key, expires_at, value, size):
+        # large payloads like tts audio are served from disk only, the memory
+        # tier is bounded by bytes as well as items
+        self._forget(key)
+        if self.db is not None and size > self.max_memory_item_bytes:
+            return
+        self.memory[key] = (expires_at, value, size)
+        self.memory_bytes += size
+        while self.memory and (
+            len(self.memory) > self.max_memory_items
+            or self.memory_bytes > self.max_memory_bytes
+        ):
+            _, (_, _, evicted_size) = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted_size
+            self.counters["evictions"] += 1
+
+    def _forget(self, key):
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= entry[2]
+
+    def _evict_disk(self, now):
+        # expired rows first, then least recently used until under the size cap
+        self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total_size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total_size <= self.max_disk_bytes:
+            return
+
+        for key, size in self.db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total_size <= self.max_disk_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            self.counters["evictions"] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["memory_items"] = len(self.memory)
+            stats["memory_bytes"] = self.memory_bytes
+            if self.db is not None:
+                stats["disk_items"], stats["disk_bytes"] = self.db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+
+
+class EmbeddingCache:
+    def __init__(self, path=None, max_entries=100_000, dimensions=768):
+        self.path = path
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+
+        self.lock = threading.Lock()
+        self.slots = OrderedDict()
+        self.free_slots = []
+        self.touched = set()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self.db = None
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self.db = sqlite3.connect(
+                os.path.join(self.path, "index.sqlite"), check_same_thread=False
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, slot INTEGER, accessed_at REAL)"
+            )
+            self.db.commit()
+
+            # least recently used first, so the OrderedDict keeps LRU order
+            for key, slot in self.db.execute(
+                "SELECT key, slot FROM embeddings ORDER BY accessed_at"
+            ):
+                self.slots[key] = slot
+
+        # a smaller max_entries than the persisted cache keeps what is already there
+        used_capacity = max([0] + [slot + 1 for slot in self.slots.values()])
+        self.max_entries = max(self.max_entries, used_capacity)
+
+        self.capacity = 0
+        self.vectors = None
+        self._grow(max(1024, used_capacity))
+
+    def _grow(self, capacity):
+        # vectors live in one contiguous float32 array, memory-mapped when persisted
+        capacity = min(max(capacity, self.capacity), self.max_entries)
+        if self.db is None:
+            vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            if self.vectors is not None:
+                vectors[: self.capacity] = self.vectors
+        else:
+            vectors_path = os.path.join(self.path, "vectors.f32")
+            with open(vectors_path, "ab") as file:
+                file.truncate(
+                    max(os.path.getsize(vectors_path), capacity * self.dimensions * 4)
+                )
+            vectors = np.memmap(
+                vectors_path,
+                dtype=np.float32,
+                mode="r+",
+                shape=(capacity, self.dimensions),
+            )
+
+        used_slots = set(self.slots.values())
+        self.free_slots.extend(
+            slot
+            for slot in range(capacity - 1, self.capacity - 1, -1)
+            if slot not in used_slots
+        )
+        self.vectors = vectors
+        self.capacity = capacity
+
+    @staticmethod
+    def make_key(model_name, task_type, text):
+        return hashlib.sha256(
+            f"{model_name}\0{task_type}\0{text}".encode("utf-8")
+        ).hexdigest()
+
+    def get_many(self, keys):
+        results = []
+        with self.lock:
+            for key in keys:
+                slot = self.slots.get(key)
+                if slot is None:
+                    self.counters["misses"] += 1
+                    results.append(None)
+                else:
+                    self.slots.move_to_end(key)
+                    self.touched.add(key)
+                    self.counters["hits"] += 1
+                    results.append(self.vectors[slot].copy())
+        misses = sum(result is None for result in results)
+        METRICS.count("cache_lookups", misses, cache="embedding", result="miss")
+        METRICS.count("cache_lookups", len(keys) - misses, cache="embedding", result="hit")
+        return results
+
+    def set_many(self, keys, vectors):
+        now = time.time()
+        rows = []
+        with self.lock:
+            for key, vector in zip(keys, vectors):
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = self._free_slot()
+                self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+                self.slots[key] = slot
+                self.slots.move_to_end(key)
+                rows.append((key, slot, now))
+
+            if self.db is not None:
+                self.vectors.flush()
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows
+                )
+                # access times of cache hits are written lazily, with the next insert
+                self.db.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in self.touched if key in self.slots],
+                )
+                self.db.commit()
+            self.touched.clear()
+
+    def _free_slot(self):
+        if not self.free_slots and self.capacity < self.max_entries:
+            self._grow(self.capacity * 2)
+        if self.free_slots:
+            return self.free_slots.pop()
+
+        # full, reuse the slot of the least recently used embedding
+        key, slot = self.slots.popitem(last=False)
+        if self.db is not None:
+            self.db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+        self.counters["evictions"] += 1
+        return slot
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.slots)
+            stats["capacity"] = self.capacity
+            stats["bytes"] = self.capacity * self.dimensions * 4
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class AnswerCache:
+    # answers to the first question of a conversation, per video; a question
+    # matches on its normalized text, or with embeddings on a near duplicate
+    # whose cosine similarity reaches the threshold. least recently used
+    # answers of a video go first, least recently asked about videos likewise
+    def __init__(
+        self,
+        max_videos=256,
+        max_answers_per_video=64,
+        ttl=24 * 3600,
+        similarity=0.95,
+    ):
+        self.max_videos = max_videos
+        self.max_answers_per_video = max_answers_per_video
+        self.ttl = ttl
+        self.similarity = similarity
+
+        self.lock = threading.Lock()
+        self.videos = OrderedDict()
+        self.counters = {
+            "exact_hits": 0,
+            "similar_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "seconds_saved": 0.0,
+        }
+
+    @staticmethod
+    def normalize(question):
+        # case, punctuation and spacing don't change the question
+        return " ".join(re.findall(r"\w+", question.lower()))
+
+    @staticmethod
+    def unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, video_id, question, embedding=None):
+        now = time.time()
+        question = self.normalize(question)
+        with self.lock:
+            answers = self.videos.get(video_id)
+            if answers is not None:
+                for key in [key for key, entry in answers.items() if entry[0] <= now]:
+                    del answers[key]
+                self.videos.move_to_end(video_id)
+
+            result, key = "miss", None
+            if answers and question in answers:
+                result, key = "exact_hit", question
+            elif answers and embedding is not None:
+                keys = [key for key, entry in answers.items() if entry[1] is not None]
+                if keys:
+                    scores = np.stack([answers[key][1] for key in keys]) @ self.unit(
+                        embedding
+                    )
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity:
+                        result, key = "similar_hit", keys[best]
+
+            METRICS.count("cache_lookups", cache="answer", result=result)
+            if key is None:
+                self.counters["misses"] += 1
+                return None
+
+            answers.move_to_end(key)
+            _, _, answer, seconds = answers[key]
+            self.counters[f"{result}s"] += 1
+            self.counters["seconds_saved"] += seconds
+        METRICS.count("answer_cache_seconds_saved", seconds)
+        return answer
+
+    def set(self, video_id, question, answer, seconds, embedding=None):
+        # seconds is what retrieval and generation took, saved by every hit
+        entry = (
+            time.time() + self.ttl,
+            None if embedding is None else self.unit(embedding),
+            answer,
+            seconds,
+        )
+        question = self.normalize(question)
+        with self.lock:
+            answers = self.videos.setdefault(video_id, OrderedDict())
+            answers[question] = entry
+            answers.move_to_end(question)
+            self.videos.move_to_end(video_id)
+            while len(answers) > self.max_answers_per_video:
+                answers.popitem(last=False)
+                self.counters["evictions"] += 1
+            while len(self.videos) > self.max_videos:
+                _, evicted = self.videos.popitem(last=False)
+                self.counters["evictions"] += len(evicted)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["videos"] = len(self.videos)
+            stats["answers"] = sum(len(answers) for answers in self.videos.values())
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stats
@@ -0,0 +1,116 @@
+from .RateLimiter import INTERACTIVE
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    # rough count for budgeting, gemini averages about four characters a token
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def message_text(message):
+    return "".join(part["text"] for part in message["parts"])
+
+
+def format_chunks(chunks, max_tokens=1500, merge_gap=45):
+    # best ranked chunks first until the budget is spent, then in playback
+    # order with chunks less than merge_gap seconds apart merged into one line
+    seen, selected, used = set(), [], 0
+    for chunk in chunks:
+        text = " ".join(chunk["text"].split())
+        if not text or text in seen:
+            continue
+        cost = estimate_tokens(text) + 3
+        if used + cost > max_tokens:
+            continue
+        seen.add(text)
+        selected.append((int(chunk["start"]), text))
+        used += cost
+
+    merged = []
+    for start, text in sorted(selected):
+        if merged and start - merged[-1][1] <= merge_gap:
+            merged[-1][1] = start
+            merged[-1][2].append(text)
+        else:
+            merged.append([start, start, [text]])
+    return "\n".join(f"[{start}] {' '.join(texts)}" for start, _, texts in merged)
+
+
+class ChatHistory:
+    # recent messages go to the model verbatim, older ones as a rolling summary
+    def __init__(
+        self, llm, window_messages=6, max_tokens=2000, summary_max_tokens=400
+    ):
+        self.llm = llm
+        self.window_messages = window_messages
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+        self.messages = []
+        self.summary = ""
+        self.summarized = 0
+        self.prompt_sizes = []
+
+    def append(self, role, text):
+        self.messages.append({"role": role, "parts": [{"text": text}]})
+
+    def window(self):
+        return self.messages[self.summarized :]
+
+    def window_tokens(self):
+        return sum(estimate_tokens(message_text(m)) for m in self.window())
+
+    def compact(self):
+        # fold the oldest user/model pairs into the summary, gemini expects the
+        # history to start with a user message; if summarizing fails they stay
+        # in the window for the next turn
+        summarized = self.summarized
+        window = self.messages[summarized:]
+        while len(window) > 2 and (
+            len(window) > self.window_messages
+            or sum(estimate_tokens(message_text(m)) for m in window) > self.max_tokens
+        ):
+            summarized += 2
+            window = self.messages[summarized:]
+        if summarized > self.summarized:
+            self.summary = self.summarize(self.messages[self.summarized : summarized])
+            self.summarized = summarized
+
+    def summarize(self, messages):
+        conversation = "\n".join(
+            f"{message['role']}: {message_text(message)}" for message in messages
+        )
+        system_prompt = (
+            "You maintain a running summary of a conversation about a YouTube video. "
+            "Update the summary with the new messages. Keep the facts, names, numbers "
+            "and timestamps the user may refer back to, and drop small talk. "
+            f"Use at most {self.summary_max_tokens * CHARS_PER_TOKEN} characters."
+            f"""Summary so far:
+            ---
+            {self.summary}
+            ---
+            New messages:
+            ---
+            {conversation}
+            ---
+            """
+        )
+        return self.llm.TextLLM(
+            system_instruction=system_prompt,
+            history=[],
+            query="Provide the updated summary below: ",
+            priority=INTERACTIVE,
+        )
+
+    def record_prompt(self, system_instruction, query):
+        # estimated tokens sent this turn against resending the whole history
+        base = estimate_tokens(system_instruction) + estimate_tokens(query)
+        size = {
+            "prompt_tokens": base + self.window_tokens(),
+            "full_history_tokens": base
+            + sum(estimate_tokens(message_text(m)) for m in self.messages)
+            - estimate_tokens(self.summary),
+        }
+        self.prompt_sizes.append(size)
+        return size
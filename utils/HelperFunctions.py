@@ -1,64 +1,160 @@
 from nltk.tokenize import sent_tokenize
 import re
 import io
+import subprocess
 import wave
 
 
-def create_chunks_with_timestamps(transcript_list):
-    chunk_size = 500
-    chunks = []
-    timestamps = []
-
-    chunk_stack = ""
-    timestamp_stack = ""
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
 
-    for i in transcript_list:
-        the_text = i["text"].strip()
-        the_timestamp = i["start"]
 
-        # if the text is longer than the chunk size
-        if len(the_text) >= chunk_size:
+def create_chunks_with_timestamps(transcript_list, chunk_size=500, overlap=0):
+    chunks = []
+    timestamps = []
 
-            # if previously any chunks exist, append them to the list
-            if chunk_stack:
-                chunks.append(chunk_stack)
-                timestamps.append(timestamp_stack)
+    for chunk, timestamp in iter_chunks_with_timestamps(
+        transcript_list, chunk_size, overlap
+    ):
+        chunks.append(chunk)
+        timestamps.append(timestamp)
 
-                # reset the stack
-                chunk_stack = ""
-                timestamp_stack = 0
+    return chunks, timestamps
 
-            # append the current chunk
-            chunks.append(the_text)
-            timestamps.append(the_timestamp)
 
-        # if the text is shorter than the chunk size
+def iter_chunks_with_timestamps(transcript_items, chunk_size=500, overlap=0):
+    # generator version, yields each (chunk, start) as soon as it is complete
+    for chunk, start, _ in iter_chunk_spans(transcript_items, chunk_size, overlap):
+        yield chunk, start
+
+
+def iter_segment_spans(transcript_items):
+    # (text, start, end) per segment; whisper segments have no duration, they
+    # end where the next one starts, so each segment waits for the next
+    previous = None
+    for item in transcript_items:
+        text = item["text"].strip()
+        if not text:
+            continue
+        start = float(item["start"])
+        if previous is not None:
+            yield previous[0], previous[1], max(previous[1], min(previous[2], start))
+        if "duration" in item:
+            end = start + float(item["duration"])
         else:
-
-            # if chunk and text combined is longer than the chunk size
-            if len(chunk_stack := chunk_stack + " " + the_text) > chunk_size:
-
-                # split the chunk stack into sentences
-                splits = chunk_stack.split(". ")
-                temp_chunk_stack = ""
-
-                # while the chunk stack is longer than the chunk size
-                while len(chunk_stack := ". ".join(splits)) > chunk_size:
-
-                    # pop the last sentence from the splits and add it to the temp chunk stack
-                    temp_chunk_stack = splits.pop() + ". " + temp_chunk_stack
-
-                # append the chunk stack and timestamp when the chunk stack is shorter than the chunk size
-                chunks.append(chunk_stack.strip())
-                timestamps.append(timestamp_stack)
-
-                # reset the stack to temp chunk stack
-                chunk_stack = temp_chunk_stack
-
-            # always update the timestamp
-            timestamp_stack = the_timestamp
-
-    return chunks, timestamps
+            end = float(item.get("end", float("inf")))
+        previous = (text, start, end)
+
+    if previous is not None:
+        end = previous[2] if previous[2] != float("inf") else previous[1]
+        yield previous[0], previous[1], max(previous[1], end)
+
+
+def iter_pieces(transcript_items, chunk_size):
+    # sentences, or word runs of run-on sentences, never longer than chunk_size,
+    # timed by their character offset into the segment
+    for text, start, end in iter_segment_spans(transcript_items):
+        seconds_per_char = (end - start) / len(text)
+        offset = 0
+        for sentence in SENTENCE_END.split(text):
+            offset = text.find(sentence, offset)
+            if len(sentence) <= chunk_size:
+                parts = [(sentence, offset)]
+            else:
+                parts = split_words(sentence, offset, chunk_size)
+            for part, part_offset in parts:
+                yield (
+                    part,
+                    start + part_offset * seconds_per_char,
+                    start + (part_offset + len(part)) * seconds_per_char,
+                )
+            offset += len(sentence)
+
+
+def split_words(text, offset, chunk_size):
+    # greedy word packing, words longer than chunk_size are cut
+    parts, words, length, part_offset = [], [], 0, offset
+    for match in re.finditer(r"\S+", text):
+        word, word_offset = match.group(), offset + match.start()
+        while len(word) > chunk_size:
+            if words:
+                parts.append((" ".join(words), part_offset))
+                words, length = [], 0
+            parts.append((word[:chunk_size], word_offset))
+            word, word_offset = word[chunk_size:], word_offset + chunk_size
+        if words and length + 1 + len(word) > chunk_size:
+            parts.append((" ".join(words), part_offset))
+            words, length = [], 0
+        if not words:
+            part_offset = word_offset
+            length = len(word)
+        else:
+            length += 1 + len(word)
+        words.append(word)
+    if words:
+        parts.append((" ".join(words), part_offset))
+    return parts
+
+
+def iter_chunk_spans(
+    transcript_items, chunk_size=500, overlap=0, sentence_boundaries=True
+):
+    # yields (chunk, start, end), chunks are whole pieces up to chunk_size
+    # characters and end on a sentence if one ends in their second half; up to
+    # overlap characters of trailing pieces are repeated in the next chunk.
+    # every piece is joined into at most a few chunks, so this is linear
+    if not 0 <= overlap < chunk_size:
+        raise ValueError("overlap must be at least 0 and less than chunk_size")
+
+    pieces, carried, length = [], 0, -1
+    for piece in iter_pieces(transcript_items, chunk_size):
+        while pieces and length + 1 + len(piece[0]) > chunk_size:
+            cut = len(pieces)
+            if sentence_boundaries:
+                cut = sentence_cut(pieces, carried, chunk_size // 2) or cut
+            chunk, rest = pieces[:cut], pieces[cut:]
+            yield " ".join(text for text, _, _ in chunk), chunk[0][1], chunk[-1][2]
+
+            tail = overlap_tail(chunk, overlap)
+            if tail and joined_length(tail + rest) + 1 + len(piece[0]) > chunk_size:
+                # no room left for the overlap
+                tail = []
+            pieces, carried = tail + rest, len(tail)
+            length = joined_length(pieces)
+
+        pieces.append(piece)
+        length += 1 + len(piece[0])
+
+    if len(pieces) > carried:
+        yield " ".join(text for text, _, _ in pieces), pieces[0][1], pieces[-1][2]
+
+
+def joined_length(pieces):
+    return sum(len(text) for text, _, _ in pieces) + len(pieces) - 1
+
+
+def sentence_cut(pieces, carried, min_length):
+    # number of pieces up to the last sentence end at least min_length in
+    # that is not part of the overlap, None if there is none
+    lengths, length = [], -1
+    for text, _, _ in pieces:
+        length += 1 + len(text)
+        lengths.append(length)
+    for index in range(len(pieces) - 1, carried - 1, -1):
+        if lengths[index] < min_length:
+            break
+        if pieces[index][0][-1] in ".!?":
+            return index + 1
+    return None
+
+
+def overlap_tail(pieces, overlap):
+    tail, length = [], -1
+    for piece in reversed(pieces):
+        if length + 1 + len(piece[0]) > overlap:
+            break
+        tail.append(piece)
+        length += 1 + len(piece[0])
+    return tail[::-1]
 
 
 def chunk_by_sentences(text, max_chars=100_000):
@@ -75,6 +171,21 @@ def chunk_by_sentences(text, max_chars=100_000):
     return chunks
 
 
+def split_for_speech(text, first_chars=300, max_chars=1500):
+    # whole sentences; a short first part so playback starts early
+    parts, current = [], ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        limit = max_chars if parts else first_chars
+        if current and len(current) + 1 + len(sentence) > limit:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
 def get_video_id(url):
     video_ids = re.findall(r"(?:v=|\/)([\w-]{11}).*", url)
 
@@ -93,3 +204,49 @@ def wave_bytesio(pcm: bytes, channels=1, rate=24000, sample_width=2) -> io.Bytes
         wf.writeframes(pcm)
     buffer.seek(0)
     return buffer
+
+
+AUDIO_MIME_TYPES = {"mp3": "audio/mpeg", "ogg": "audio/ogg", "wav": "audio/wav"}
+
+
+def pcm_seconds(pcm, channels=1, rate=24000, sample_width=2):
+    return len(pcm) / (channels * rate * sample_width)
+
+
+def encode_audio(pcm, audio_format="mp3", bitrate="32k", channels=1, rate=24000):
+    # compressed speech is about a tenth of the wav; returns (bytes, format)
+    # and falls back to wav when ffmpeg is missing or fails
+    codecs = {"mp3": ["-c:a", "libmp3lame"], "ogg": ["-c:a", "libopus"]}
+    if audio_format in codecs:
+        try:
+            return (
+                subprocess.run(
+                    [
+                        "ffmpeg",
+                        "-hide_banner",
+                        "-loglevel",
+                        "error",
+                        "-f",
+                        "s16le",
+                        "-ar",
+                        str(rate),
+                        "-ac",
+                        str(channels),
+                        "-i",
+                        "pipe:0",
+                        *codecs[audio_format],
+                        "-b:a",
+                        bitrate,
+                        "-f",
+                        audio_format,
+                        "pipe:1",
+                    ],
+                    input=pcm,
+                    capture_output=True,
+                    check=True,
+                ).stdout,
+                audio_format,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return wave_bytesio(pcm, channels, rate).getvalue(), "wav"
@@ -0,0 +1,112 @@
+import time
+
+from .HelperFunctions import iter_chunks_with_timestamps
+from .LLM import EMBEDDING_MODEL
+from .Metrics import METRICS
+from .Transcript import Transcript
+from DataBases.VectorStore import IncrementalIndexer
+
+
+def collect_transcript(transcript_parts, transcript_list):
+    # flattens the transcript parts, keeping a copy for the artifact store
+    for transcript_part in transcript_parts:
+        transcript_list.extend(transcript_part)
+        yield from transcript_part
+
+
+def is_indexed(registry, video_id, vector_store):
+    manifest = registry.manifest()
+    manifest_entry = manifest.get(video_id)
+    if manifest_entry is None and vector_store.collection is not None:
+        # videos indexed before the manifest, one id is enough to know; only
+        # the process owning the chroma db can look, it checks before queueing
+        legacy_ids = vector_store.collection.get(
+            where={"youtube_id": video_id}, limit=1, include=[]
+        )["ids"]
+        if legacy_ids:
+            manifest.backfill(video_id, chunk_count=None)
+            manifest_entry = manifest.get(video_id)
+
+    return bool(manifest_entry and manifest_entry["status"] == "ready")
+
+
+def ingest_video(
+    job,
+    video_id,
+    groq_api_key,
+    gemini_api_key,
+    registry,
+    transcript=None,
+    poll_interval=2,
+):
+    transcript = transcript or Transcript(cache=registry.transcript_cache())
+    manifest = registry.manifest()
+    vector_store = registry.vector_store(gemini_api_key)
+
+    # another process may own this video, wait for it instead of ingesting twice
+    waiting = False
+    while True:
+        if is_indexed(registry, video_id, vector_store):
+            job.report("Transcript already exist in vector db")
+            job.mark_ready()
+            return None
+        if manifest.try_begin(video_id, EMBEDDING_MODEL):
+            break
+        if not waiting:
+            job.report("This video is being processed elsewhere, waiting for it")
+            waiting = True
+        time.sleep(poll_interval)
+
+    job.report("Downloading transcript...")
+
+    # transcript with youtube api
+    try:
+        transcript_parts = [transcript.with_youtube_api(video_id)]
+        manifest.update(video_id, transcript_source="youtube_api")
+        job.report("Transcript successfully with YouTube API")
+    except Exception as error:
+        # whisper transcripts come in part by part as the audio downloads
+        reason = getattr(error, "reason", type(error).__name__)
+        job.report(f"No usable YouTube captions ({reason}), trying with Whisper")
+        transcript_parts = transcript.with_whisper_stream(
+            groq_api_key, video_id, llm=registry.groq_llm(groq_api_key)
+        )
+        manifest.update(video_id, transcript_source="whisper")
+
+    # chunk, embed and store in the background as the transcript streams in
+    transcript_list = []
+    indexer = IncrementalIndexer(
+        vector_store,
+        video_id,
+        manifest=manifest,
+        progress=lambda indexed: job.report(f"{indexed} chunks searchable"),
+    ).start(
+        # chunking time excludes the time spent waiting on the transcript
+        METRICS.timed_iter(
+            "chunking",
+            iter_chunks_with_timestamps(
+                METRICS.timed_iter(
+                    "transcript_stream",
+                    collect_transcript(transcript_parts, transcript_list),
+                )
+            ),
+        )
+    )
+
+    indexer.first_batch.wait()
+    if indexer.indexed:
+        job.mark_ready()
+
+    indexer.finished.wait()
+    if indexer.error is not None:
+        raise indexer.error
+    job.report("Documents added to vector db successfully")
+
+    # keep the artifacts for the next session of this video
+    registry.artifact_store().save(
+        video_id,
+        transcript=transcript_list,
+        chunks=indexer.chunks,
+        timestamps=indexer.timestamps,
+    )
+    return {"chunks": indexer.chunks, "timestamps": indexer.timestamps}
@@ -0,0 +1,54 @@
+import threading
+
+
+class Job:
+    # in-process single flight work; ingestion progress goes through the job
+    # queue, see utils.Workers
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.error = None
+        self.finished = threading.Event()
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        self.finished.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class JobCoordinator:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, key, function):
+        # single flight: the first caller for a key owns the work, later callers
+        # get the same running job; returns (job, is_owner)
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                return job, False
+            job = self.jobs[key] = Job(key)
+
+        threading.Thread(target=self.run, args=(job, function), daemon=True).start()
+        return job, True
+
+    def run(self, job, function):
+        try:
+            job.result = function(job)
+        except Exception as error:
+            job.error = error
+        finally:
+            # release the key first, failures can be retried straight away
+            with self.lock:
+                self.jobs.pop(job.key, None)
+            job.finished.set()
+
+    def running(self):
+        with self.lock:
+            return list(self.jobs)
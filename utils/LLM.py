@@ -1,51 +1,325 @@
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor
+from groq import AsyncGroq, Groq
 from google import genai
 from google.genai import types
+from .Cache import MISSING
+from .ChatContext import estimate_tokens, message_text
+from .HelperFunctions import split_for_speech
+from .Metrics import METRICS
+from .RateLimiter import BACKGROUND, INTERACTIVE, RATE_LIMITS
+import asyncio
+import numpy as np
 import os
+import queue
+import threading
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+
+def read_bytes(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def prompt_tokens(system_instruction, history, query):
+    # estimates for the tokens per minute budget
+    return estimate_tokens(
+        system_instruction + query + "".join(message_text(m) for m in history)
+    )
+
+
+def embedding_tokens(contents):
+    texts = [contents] if isinstance(contents, str) else contents
+    return sum(estimate_tokens(text) for text in texts)
 
 
 class GroqLLM:
-    def __init__(self, api_key):
+    def __init__(
+        self, api_key, max_workers=4, max_retries=5, backoff=2.0, rate_limits=None
+    ):
         self.llm = Groq(api_key=api_key)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limits = rate_limits or RATE_LIMITS
+
+    def transcribe(self, audio_path, model_name="whisper-large-v3-turbo"):
+        audio_bytes = read_bytes(audio_path)
+
+        def create():
+            METRICS.count("api_calls", provider="groq", endpoint="transcription")
+            METRICS.count("audio_bytes", len(audio_bytes), stage="upload")
+            with METRICS.span("whisper_transcribe"):
+                return self.llm.audio.transcriptions.create(
+                    file=(audio_path, audio_bytes),
+                    language="en",
+                    model=model_name,
+                    response_format="verbose_json",
+                )
+
+        # 429s and 5xx are retried with the provider's queue paused
+        return self.rate_limits.limiter("groq", model_name).call(
+            create, max_retries=self.max_retries, backoff=self.backoff
+        )
+
+    def transcribe_segment(self, audio_path, model_name):
+        try:
+            return self.transcribe(audio_path, model_name)
+        finally:
+            remove_file(audio_path)
 
-    def AudioLLM(self, audio_paths, model_name="whisper-large-v3-turbo"):
-        self.audio_paths = audio_paths
-        self.model_name = model_name
-        self.transcription_lists = []
+    def AudioLLM(
+        self, audio_paths, model_name="whisper-large-v3-turbo", start_times=None
+    ):
+        with METRICS.span("whisper_audio_llm"), ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_workers, len(audio_paths)))
+        ) as executor:
+            transcriptions = list(
+                executor.map(
+                    lambda audio_path: self.transcribe_segment(audio_path, model_name),
+                    audio_paths,
+                )
+            )
+
+        return self.transcriptions_to_list(transcriptions, start_times)
+
+    @staticmethod
+    def transcriptions_to_list(transcriptions, start_times=None):
+        # without known segment starts, chain the reported audio durations
+        if start_times is None:
+            start_times = [0.0]
+            for transcription in transcriptions[:-1]:
+                duration = getattr(transcription, "duration", None)
+                if duration is None:
+                    duration = transcription.segments[-1]["end"]
+                start_times.append(start_times[-1] + duration)
+
+        transcription_lists = []
+        for transcription, start_time in zip(transcriptions, start_times):
+            transcription_lists.extend(
+                GroqLLM.transcription_to_list(transcription, start_time)
+            )
+
+        return transcription_lists
+
+    def AudioLLMStream(self, segments, model_name="whisper-large-v3-turbo"):
+        # segments is an iterable of (path, start time) that may still be producing;
+        # a producer thread submits each one as it arrives, transcripts come out in order
+        executor = ThreadPoolExecutor(max_workers=max(1, self.max_workers))
+        submitted = queue.Queue()
+        # the segments submitted so far; once stopped, no more are submitted
+        lock = threading.Lock()
+        futures = []
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for audio_path, start_time in segments:
+                    with lock:
+                        if stopped.is_set():
+                            remove_file(audio_path)
+                            break
+                        future = executor.submit(
+                            self.transcribe_segment, audio_path, model_name
+                        )
+                        futures.append((future, audio_path))
+                    submitted.put((future, start_time))
+            except Exception as error:
+                submitted.put((error, None))
+            finally:
+                # stops the download and segmenting when the consumer gave up
+                close = getattr(segments, "close", None)
+                if close is not None:
+                    close()
+                submitted.put(None)
 
-        self.previous_start_time = 0
-        for audio_path in self.audio_paths:
-            with open(audio_path, "rb") as file:
-                self.transcription = self.llm.audio.transcriptions.create(
-                    file=(audio_path, file.read()),
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while (item := submitted.get()) is not None:
+                future, start_time = item
+                if isinstance(future, Exception):
+                    raise future
+                yield self.transcription_to_list(future.result(), start_time)
+        finally:
+            with lock:
+                stopped.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                # segments that will never be transcribed
+                for future, audio_path in futures:
+                    if future.cancelled():
+                        remove_file(audio_path)
+
+    @staticmethod
+    def transcription_to_list(transcription, start_time):
+        return [
+            {
+                "text": each_transcription_segment["text"].strip(),
+                "start": each_transcription_segment["start"] + start_time,
+                "end": each_transcription_segment["end"] + start_time,
+            }
+            for each_transcription_segment in transcription.segments
+            if each_transcription_segment["text"].strip()
+        ]
+
+
+class AsyncGroqLLM:
+    # GroqLLM's transcription as coroutines on one pooled async client, so a
+    # single event loop can transcribe for many videos at once
+    def __init__(
+        self, api_key, max_workers=4, max_retries=5, backoff=2.0, rate_limits=None
+    ):
+        self.llm = AsyncGroq(api_key=api_key)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limits = rate_limits or RATE_LIMITS
+
+    async def transcribe(self, audio_path, model_name="whisper-large-v3-turbo"):
+        audio_bytes = await asyncio.to_thread(read_bytes, audio_path)
+
+        async def create():
+            METRICS.count("api_calls", provider="groq", endpoint="transcription")
+            METRICS.count("audio_bytes", len(audio_bytes), stage="upload")
+            with METRICS.span("whisper_transcribe"):
+                return await self.llm.audio.transcriptions.create(
+                    file=(audio_path, audio_bytes),
                     language="en",
-                    model=self.model_name,
+                    model=model_name,
                     response_format="verbose_json",
                 )
 
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
+        return await self.rate_limits.limiter("groq", model_name).call_async(
+            create, max_retries=self.max_retries, backoff=self.backoff
+        )
+
+    async def transcribe_segment(self, audio_path, model_name, semaphore):
+        try:
+            async with semaphore:
+                return await self.transcribe(audio_path, model_name)
+        finally:
+            remove_file(audio_path)
+
+    async def AudioLLM(
+        self, audio_paths, model_name="whisper-large-v3-turbo", start_times=None
+    ):
+        semaphore = asyncio.Semaphore(max(1, self.max_workers))
+        with METRICS.span("whisper_audio_llm"):
+            transcriptions = await asyncio.gather(
+                *(
+                    self.transcribe_segment(audio_path, model_name, semaphore)
+                    for audio_path in audio_paths
+                )
+            )
+        return GroqLLM.transcriptions_to_list(transcriptions, start_times)
+
+    async def AudioLLMStream(self, segments, model_name="whisper-large-v3-turbo"):
+        # segments is a blocking iterable of (path, start time), like the audio
+        # downloader's; it is pulled on a thread and every segment becomes a
+        # task as it arrives, transcripts come out in order
+        semaphore = asyncio.Semaphore(max(1, self.max_workers))
+        submitted = asyncio.Queue()
+        tasks = []
+        # one thread pulls the iterator, so the cleanup runs after a pending
+        # next; pulls holds the next calls whose segment wasn't taken yet
+        puller = ThreadPoolExecutor(max_workers=1)
+        iterator = iter(segments)
+        pulls = []
+
+        async def produce():
+            try:
+                while True:
+                    pull = puller.submit(next, iterator, None)
+                    pulls.append(pull)
+                    segment = await asyncio.wrap_future(pull)
+                    pulls.remove(pull)
+                    if segment is None:
+                        break
+                    audio_path, start_time = segment
+                    task = asyncio.create_task(
+                        self.transcribe_segment(audio_path, model_name, semaphore)
+                    )
+                    tasks.append((task, audio_path))
+                    submitted.put_nowait((task, start_time))
+            except Exception as error:
+                submitted.put_nowait((error, None))
+            finally:
+                submitted.put_nowait(None)
 
-            self.transcription_segments = self.transcription.segments
-            self.transcription_list = [
-                {
-                    "text": each_transcription_segment["text"].strip(),
-                    "start": each_transcription_segment["start"]
-                    + self.previous_start_time,
-                }
-                for each_transcription_segment in self.transcription_segments
-                if each_transcription_segment["text"].strip()
-            ]
-            self.transcription_lists.extend(self.transcription_list)
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await submitted.get()) is not None:
+                task, start_time = item
+                if isinstance(task, Exception):
+                    raise task
+                yield GroqLLM.transcription_to_list(await task, start_time)
+        finally:
+            producer.cancel()
 
-            self.previous_start_time = self.transcription_segments[-1]["start"]
+            def close():
+                # a segment pulled for the cancelled producer, then the download
+                # and segmenting stop when the consumer gave up
+                for pull in pulls:
+                    if not pull.cancelled() and pull.exception() is None:
+                        if pull.result() is not None:
+                            remove_file(pull.result()[0])
+                if hasattr(iterator, "close"):
+                    iterator.close()
 
-        return self.transcription_lists
+            puller.submit(close)
+            puller.shutdown(wait=False)
+            # a task cancelled before it started never deletes its segment
+            for task, audio_path in tasks:
+                if not task.done():
+                    task.cancel()
+                    remove_file(audio_path)
 
 
 class GeminiLLM:
-    def __init__(self, api_key):
+    def __init__(
+        self,
+        api_key,
+        cache=None,
+        embedding_cache=None,
+        max_retries=5,
+        backoff=2.0,
+        rate_limits=None,
+    ):
         self.llm = genai.Client(api_key=api_key)
+        self.cache = cache
+        self.embedding_cache = embedding_cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limits = rate_limits or RATE_LIMITS
+
+    def cached(self, key_parts, function):
+        if self.cache is None:
+            return function()
+        return self.cache.get_or_call(self.cache.make_key(*key_parts), function)
+
+    def limited(self, model_name, function, tokens, priority):
+        # queued behind the model's budget, 429s and 5xx retried
+        return self.rate_limits.limiter("gemini", model_name).call(
+            function, tokens, priority, self.max_retries, self.backoff
+        )
+
+    @staticmethod
+    def count_usage(response, endpoint):
+        METRICS.count("api_calls", provider="gemini", endpoint=endpoint)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            for kind, tokens in [
+                ("prompt", usage.prompt_token_count),
+                ("output", usage.candidates_token_count),
+            ]:
+                if tokens:
+                    METRICS.count("tokens", tokens, provider="gemini", kind=kind)
 
     def TextLLM(
         self,
@@ -53,53 +327,454 @@ class GeminiLLM:
         history,
         query,
         model_name="gemini-2.5-flash-preview-05-20",
+        priority=BACKGROUND,
     ):
-        self.history = history
-        self.system_instruction = system_instruction
-        self.model_name = model_name
+        # no per-call state on self, the summarizer calls this from several threads
+        def generate():
+            chat = self.llm.chats.create(
+                model=model_name,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_instruction
+                ),
+                history=history,
+            )
 
-        self.model = self.llm.chats.create(
-            model=self.model_name,
-            config=types.GenerateContentConfig(
-                system_instruction=self.system_instruction
-            ),
-            history=self.history,
+            def send():
+                with METRICS.span("gemini_text"):
+                    return chat.send_message(query)
+
+            response = self.limited(
+                model_name,
+                send,
+                prompt_tokens(system_instruction, history, query),
+                priority,
+            )
+            self.count_usage(response, "text")
+            return response.text
+
+        return self.cached(
+            ("text", model_name, system_instruction, history, query), generate
         )
-        self.response = self.model.send_message(query)
-        return self.response.text
-
-    def TTS(self, texts):
-        self.response = self.llm.models.generate_content(
-            model="gemini-2.5-flash-preview-tts",
-            contents=f"Read aloud in a energetic and friendly tone: {texts}",
-            config=types.GenerateContentConfig(
-                response_modalities=["AUDIO"],
-                speech_config=types.SpeechConfig(
-                    voice_config=types.VoiceConfig(
-                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                            voice_name="Zephyr",
-                        )
+
+    def TextLLMStream(
+        self,
+        system_instruction,
+        history,
+        query,
+        model_name="gemini-2.5-flash-preview-05-20",
+        priority=INTERACTIVE,
+    ):
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(
+                "text", model_name, system_instruction, history, query
+            )
+            cached_text = self.cache.get(key)
+            if cached_text is not MISSING:
+                yield cached_text
+                return
+
+        chat = self.llm.chats.create(
+            model=model_name,
+            config=types.GenerateContentConfig(system_instruction=system_instruction),
+            history=history,
+        )
+
+        def open_stream():
+            # errors surface on the first chunk, so that is part of the retried call
+            chunks = iter(chat.send_message_stream(query))
+            return next(chunks, None), chunks
+
+        def stream():
+            first, chunks = self.limited(
+                model_name,
+                open_stream,
+                prompt_tokens(system_instruction, history, query),
+                priority,
+            )
+            if first is not None:
+                yield first
+            yield from chunks
+
+        # yield text deltas as they arrive, cache the full answer once it is complete
+        texts = []
+        chunk = None
+        for chunk in METRICS.timed_iter("gemini_text_stream", stream()):
+            if chunk.text:
+                texts.append(chunk.text)
+                yield chunk.text
+        # the last chunk carries the usage of the whole answer
+        self.count_usage(chunk, "text_stream")
+
+        if key is not None:
+            self.cache.set(key, "".join(texts))
+
+    def TTS(
+        self,
+        texts,
+        model_name="gemini-2.5-flash-preview-tts",
+        voice_name="Zephyr",
+        priority=INTERACTIVE,
+    ):
+        contents = f"Read aloud in a energetic and friendly tone: {texts}"
+        return self.cached(
+            ("tts", model_name, voice_name, contents),
+            lambda: self.generate_speech(contents, model_name, voice_name, priority),
+        )
+
+    def TTSStream(
+        self,
+        texts,
+        model_name="gemini-2.5-flash-preview-tts",
+        voice_name="Zephyr",
+        first_chars=300,
+        max_chars=1500,
+        max_workers=4,
+    ):
+        # sentence-aligned parts synthesized concurrently, pcm yielded in order
+        parts = split_for_speech(texts, first_chars, max_chars)
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(parts))))
+        futures = [
+            executor.submit(self.TTS, part, model_name, voice_name) for part in parts
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def generate_speech(self, contents, model_name, voice_name, priority=INTERACTIVE):
+        def generate():
+            with METRICS.span("tts"):
+                return self.llm.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=self.speech_config(voice_name),
+                )
+
+        return self.speech_audio(
+            self.limited(model_name, generate, estimate_tokens(contents), priority)
+        )
+
+    @staticmethod
+    def speech_config(voice_name):
+        return types.GenerateContentConfig(
+            response_modalities=["AUDIO"],
+            speech_config=types.SpeechConfig(
+                voice_config=types.VoiceConfig(
+                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                        voice_name=voice_name,
                     )
-                ),
+                )
             ),
         )
-        return self.response.candidates[0].content.parts[0].inline_data.data
+
+    @staticmethod
+    def speech_audio(response):
+        GeminiLLM.count_usage(response, "tts")
+        audio = response.candidates[0].content.parts[0].inline_data.data
+        METRICS.count("audio_bytes", len(audio), stage="tts")
+        return audio
 
     def __call__(self, input):
-        self.input = input
+        return self.embed(input)
+
+    def embed_query(self, input):
+        # newer chromadb versions embed query texts through this; someone is
+        # waiting on the answer
+        return self.embed(input, priority=INTERACTIVE)
 
-        self.embedding = self.llm.models.embed_content(
-            model="models/text-embedding-004",
-            contents=self.input,
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
+    def embed(
+        self,
+        input,
+        model_name=EMBEDDING_MODEL,
+        task_type="SEMANTIC_SIMILARITY",
+        priority=BACKGROUND,
+    ):
+        def embed_content(contents):
+            def request():
+                METRICS.count("api_calls", provider="gemini", endpoint="embed")
+                METRICS.count(
+                    "embedded_texts", 1 if isinstance(contents, str) else len(contents)
+                )
+                with METRICS.span("gemini_embed"):
+                    return self.llm.models.embed_content(
+                        model=model_name,
+                        contents=contents,
+                        config=types.EmbedContentConfig(task_type=task_type),
+                    )
+
+            embedding = self.limited(
+                model_name, request, embedding_tokens(contents), priority
+            )
+            return [each_embedding.values for each_embedding in embedding.embeddings]
+
+        if self.embedding_cache is None:
+            return self.cached(
+                ("embed", model_name, task_type, input), lambda: embed_content(input)
+            )
+
+        # per text lookups, only the misses go to the API
+        keys, embeddings, misses = self.lookup_embeddings(
+            self.embedding_cache, input, model_name, task_type
         )
+        if misses:
+            embeddings = self.fill_embeddings(
+                self.embedding_cache,
+                keys,
+                embeddings,
+                misses,
+                embed_content(list(misses.values())),
+            )
+        return embeddings
+
+    @staticmethod
+    def lookup_embeddings(embedding_cache, input, model_name, task_type):
+        # (keys, cached embeddings or None, {key: text} of the misses)
+        texts = [input] if isinstance(input, str) else list(input)
+        keys = [embedding_cache.make_key(model_name, task_type, text) for text in texts]
+        embeddings = embedding_cache.get_many(keys)
+
+        misses = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                misses[key] = text
+        return keys, embeddings, misses
 
-        return [each_embedding.values for each_embedding in self.embedding.embeddings]
+    @staticmethod
+    def fill_embeddings(embedding_cache, keys, embeddings, misses, missed_embeddings):
+        missed_embeddings = np.asarray(missed_embeddings, dtype=np.float32)
+        embedding_cache.set_many(list(misses), missed_embeddings)
+        missed_embeddings = dict(zip(misses, missed_embeddings))
+        return [
+            missed_embeddings[key] if embedding is None else embedding
+            for key, embedding in zip(keys, embeddings)
+        ]
 
     def name(self):
         return "gemini_embedding"
 
 
+class AsyncGeminiLLM:
+    # GeminiLLM's calls as coroutines on the client's async api, sharing the
+    # same response and embedding cache keys; no per-call state, so one
+    # instance serves every request on an event loop
+    def __init__(
+        self,
+        api_key,
+        cache=None,
+        embedding_cache=None,
+        max_retries=5,
+        backoff=2.0,
+        rate_limits=None,
+    ):
+        self.llm = genai.Client(api_key=api_key).aio
+        self.cache = cache
+        self.embedding_cache = embedding_cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limits = rate_limits or RATE_LIMITS
+
+    async def cached(self, key_parts, function):
+        # the cache lookups are local and short, they run on the event loop
+        if self.cache is None:
+            return await function()
+        key = self.cache.make_key(*key_parts)
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = await function()
+            self.cache.set(key, value)
+        return value
+
+    async def limited(self, model_name, function, tokens, priority):
+        return await self.rate_limits.limiter("gemini", model_name).call_async(
+            function, tokens, priority, self.max_retries, self.backoff
+        )
+
+    async def TextLLM(
+        self,
+        system_instruction,
+        history,
+        query,
+        model_name="gemini-2.5-flash-preview-05-20",
+        priority=BACKGROUND,
+    ):
+        async def generate():
+            chat = self.llm.chats.create(
+                model=model_name,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_instruction
+                ),
+                history=history,
+            )
+
+            async def send():
+                with METRICS.span("gemini_text"):
+                    return await chat.send_message(query)
+
+            response = await self.limited(
+                model_name,
+                send,
+                prompt_tokens(system_instruction, history, query),
+                priority,
+            )
+            GeminiLLM.count_usage(response, "text")
+            return response.text
+
+        return await self.cached(
+            ("text", model_name, system_instruction, history, query), generate
+        )
+
+    async def TextLLMStream(
+        self,
+        system_instruction,
+        history,
+        query,
+        model_name="gemini-2.5-flash-preview-05-20",
+        priority=INTERACTIVE,
+    ):
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(
+                "text", model_name, system_instruction, history, query
+            )
+            cached_text = self.cache.get(key)
+            if cached_text is not MISSING:
+                yield cached_text
+                return
+
+        chat = self.llm.chats.create(
+            model=model_name,
+            config=types.GenerateContentConfig(system_instruction=system_instruction),
+            history=history,
+        )
+
+        async def open_stream():
+            chunks = (await chat.send_message_stream(query)).__aiter__()
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return None, chunks
+
+        async def stream():
+            first, chunks = await self.limited(
+                model_name,
+                open_stream,
+                prompt_tokens(system_instruction, history, query),
+                priority,
+            )
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+
+        texts = []
+        chunk = None
+        async for chunk in METRICS.timed_aiter("gemini_text_stream", stream()):
+            if chunk.text:
+                texts.append(chunk.text)
+                yield chunk.text
+        GeminiLLM.count_usage(chunk, "text_stream")
+
+        if key is not None:
+            self.cache.set(key, "".join(texts))
+
+    async def TTS(
+        self,
+        texts,
+        model_name="gemini-2.5-flash-preview-tts",
+        voice_name="Zephyr",
+        priority=INTERACTIVE,
+    ):
+        contents = f"Read aloud in a energetic and friendly tone: {texts}"
+
+        async def request():
+            with METRICS.span("tts"):
+                return await self.llm.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=GeminiLLM.speech_config(voice_name),
+                )
+
+        async def generate():
+            return GeminiLLM.speech_audio(
+                await self.limited(
+                    model_name, request, estimate_tokens(contents), priority
+                )
+            )
+
+        return await self.cached(("tts", model_name, voice_name, contents), generate)
+
+    async def TTSStream(
+        self,
+        texts,
+        model_name="gemini-2.5-flash-preview-tts",
+        voice_name="Zephyr",
+        first_chars=300,
+        max_chars=1500,
+        max_workers=4,
+    ):
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+
+        async def speak(part):
+            async with semaphore:
+                return await self.TTS(part, model_name, voice_name)
+
+        tasks = [
+            asyncio.create_task(speak(part))
+            for part in split_for_speech(texts, first_chars, max_chars)
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def embed(
+        self,
+        input,
+        model_name=EMBEDDING_MODEL,
+        task_type="SEMANTIC_SIMILARITY",
+        priority=BACKGROUND,
+    ):
+        async def embed_content(contents):
+            async def request():
+                METRICS.count("api_calls", provider="gemini", endpoint="embed")
+                METRICS.count(
+                    "embedded_texts", 1 if isinstance(contents, str) else len(contents)
+                )
+                with METRICS.span("gemini_embed"):
+                    return await self.llm.models.embed_content(
+                        model=model_name,
+                        contents=contents,
+                        config=types.EmbedContentConfig(task_type=task_type),
+                    )
+
+            embedding = await self.limited(
+                model_name, request, embedding_tokens(contents), priority
+            )
+            return [each_embedding.values for each_embedding in embedding.embeddings]
+
+        if self.embedding_cache is None:
+            return await self.cached(
+                ("embed", model_name, task_type, input), lambda: embed_content(input)
+            )
+
+        keys, embeddings, misses = GeminiLLM.lookup_embeddings(
+            self.embedding_cache, input, model_name, task_type
+        )
+        if misses:
+            embeddings = GeminiLLM.fill_embeddings(
+                self.embedding_cache,
+                keys,
+                embeddings,
+                misses,
+                await embed_content(list(misses.values())),
+            )
+        return embeddings
+
+
 if __name__ == "__main__":
     import os
     from dotenv import load_dotenv
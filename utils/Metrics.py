@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 1, 2.5, 10, 30, 120, 600)
+
+
+class Metrics:
+    # counters and span duration histograms, exported as prometheus text or
+    # appended as json lines; labels are keyword arguments
+    def __init__(self, jsonl_path=None, buckets=DEFAULT_BUCKETS, prefix="yt_qna"):
+        self.jsonl_path = jsonl_path
+        self.buckets = buckets
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.local = threading.local()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def count(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.write_event({"type": "count", "name": name, "value": value, **labels})
+
+    def gauge(self, name, value, **labels):
+        # last value wins, for levels like queue depths; not written as events
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self.write_event({"type": "observe", "name": name, "value": value, **labels})
+
+    @contextmanager
+    def span(self, name, **labels):
+        # wall time of the block, including nested spans
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def timed_iter(self, name, iterable, **labels):
+        # time spent producing items only, excluding nested timed_iter producers
+        # it pulls from and the consumer's work between items
+        stack = self.local.__dict__.setdefault("stack", [])
+        iterator = iter(iterable)
+        total = 0.0
+        try:
+            while True:
+                stack.append(0.0)
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed = time.perf_counter() - start
+                    nested = stack.pop()
+                    total += elapsed - nested
+                    if stack:
+                        stack[-1] += elapsed
+                yield item
+        finally:
+            self.observe(f"{name}_seconds", total, **labels)
+
+    async def timed_aiter(self, name, aiterable, **labels):
+        # time spent awaiting items; other tasks run during the awaits, so on a
+        # busy event loop this includes some of their time
+        iterator = aiterable.__aiter__()
+        total = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    total += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(f"{name}_seconds", total, **labels)
+
+    def write_event(self, event):
+        if self.jsonl_path is None:
+            return
+        line = json.dumps({"ts": time.time(), "pid": os.getpid(), **event}) + "\n"
+        # one short append per event, whole lines from several processes
+        with open(self.jsonl_path, "a") as file:
+            file.write(line)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {
+                    key: (histogram[1], histogram[2])
+                    for key, histogram in self.histograms.items()
+                },
+            }
+
+    @staticmethod
+    def breakdown(before, after):
+        # per stage seconds and counters between two snapshots, for one request
+        # in a process that handles one request at a time
+        def name(key):
+            return ",".join([key[0]] + [f"{k}={v}" for k, v in key[1]])
+
+        stages = {}
+        for key, (seconds, calls) in after["histograms"].items():
+            seconds_before, calls_before = before["histograms"].get(key, (0.0, 0))
+            if calls > calls_before:
+                stages[name(key)] = {
+                    "seconds": round(seconds - seconds_before, 3),
+                    "calls": calls - calls_before,
+                }
+        counters = {
+            name(key): value - before["counters"].get(key, 0)
+            for key, value in after["counters"].items()
+            if value != before["counters"].get(key, 0)
+        }
+        return {"stages": stages, "counters": counters}
+
+    def prometheus_text(self):
+        def labels_text(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines, typed = [], set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{labels_text(labels)} {value}")
+
+            for (name, labels), value in sorted(self.gauges.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric}{labels_text(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                for bound, count in zip(self.buckets, histogram[0]):
+                    le = labels_text(labels, [("le", bound)])
+                    lines.append(f"{metric}_bucket{le} {count}")
+                le = labels_text(labels, [("le", "+Inf")])
+                lines.append(f"{metric}_bucket{le} {histogram[2]}")
+                lines.append(f"{metric}_sum{labels_text(labels)} {histogram[1]}")
+                lines.append(f"{metric}_count{labels_text(labels)} {histogram[2]}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        # prometheus scrape endpoint on /metrics, in a daemon thread
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# one registry per process, configured from the environment
+METRICS = Metrics(os.getenv("METRICS_JSONL") or None)
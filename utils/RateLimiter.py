@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from .Metrics import METRICS
+
+# lower goes first: a question someone is waiting on before summaries and
+# embeddings running in the background
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+def error_status(error):
+    # groq errors carry status_code, google.genai errors code
+    for attribute in ("status_code", "code"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_rate_limited(error):
+    return error_status(error) == 429
+
+
+def is_retryable(error):
+    status = error_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_delay(error, attempt, backoff):
+    # exponential backoff with jitter, or what the server asks for
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        delay = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        delay = backoff * 2**attempt
+    return delay + random.uniform(0, backoff)
+
+
+class TokenBucket:
+    # per_minute units refilled continuously, bursts of up to a minute's worth;
+    # a request larger than that waits for a full bucket and leaves it in debt
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        self.level = min(
+            self.per_minute,
+            self.level + (now - self.updated) * self.per_minute / 60,
+        )
+        self.updated = now
+        amount = min(amount, self.per_minute)
+        return max(0.0, (amount - self.level) * 60 / self.per_minute)
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class ProviderLimiter:
+    # request and token budgets of one provider and model, shared by every
+    # thread and event loop of the process. callers queue by priority, then
+    # arrival; a 429 or 5xx pauses the whole queue for the server's retry-after
+    # or a backoff that doubles with every throttle in a row
+    def __init__(
+        self,
+        provider,
+        model,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        poll_interval=0.05,
+    ):
+        self.labels = {"provider": provider, "model": model}
+        self.requests = requests_per_minute and TokenBucket(requests_per_minute)
+        self.tokens = tokens_per_minute and TokenBucket(tokens_per_minute)
+        self.poll_interval = poll_interval
+
+        self.condition = threading.Condition()
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.paused_until = 0.0
+        self.throttles = 0
+
+    def wait_time(self, tokens, now):
+        waits = [self.paused_until - now]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def enqueue(self, priority):
+        ticket = (priority, next(self.sequence))
+        heapq.heappush(self.waiters, ticket)
+        METRICS.gauge("rate_limit_queue_depth", len(self.waiters), **self.labels)
+        return ticket
+
+    def dequeue(self, ticket):
+        self.waiters.remove(ticket)
+        heapq.heapify(self.waiters)
+        METRICS.gauge("rate_limit_queue_depth", len(self.waiters), **self.labels)
+        self.condition.notify_all()
+
+    def poll(self, ticket, tokens):
+        # 0.0 once granted, else how long to wait, None behind another caller
+        if self.waiters[0] != ticket:
+            return None
+        wait = self.wait_time(tokens, time.monotonic())
+        if wait > 0:
+            return wait
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and tokens:
+            self.tokens.take(tokens)
+        self.dequeue(ticket)
+        return 0.0
+
+    def acquire(self, tokens=0, priority=BACKGROUND):
+        start = time.monotonic()
+        with self.condition:
+            ticket = self.enqueue(priority)
+            try:
+                while (wait := self.poll(ticket, tokens)) != 0.0:
+                    self.condition.wait(wait)
+            except BaseException:
+                self.dequeue(ticket)
+                raise
+        self.waited(time.monotonic() - start, priority)
+
+    async def acquire_async(self, tokens=0, priority=BACKGROUND):
+        # an event loop can't block on the condition, it polls instead
+        start = time.monotonic()
+        with self.condition:
+            ticket = self.enqueue(priority)
+        try:
+            while True:
+                with self.condition:
+                    wait = self.poll(ticket, tokens)
+                if wait == 0.0:
+                    break
+                await asyncio.sleep(min(wait or self.poll_interval, self.poll_interval))
+        except BaseException:
+            with self.condition:
+                if ticket in self.waiters:
+                    self.dequeue(ticket)
+            raise
+        self.waited(time.monotonic() - start, priority)
+
+    def waited(self, seconds, priority):
+        if seconds > 0.001:
+            METRICS.count(
+                "rate_limit_throttled", priority=PRIORITY_NAMES[priority], **self.labels
+            )
+            METRICS.observe(
+                "rate_limit_wait_seconds",
+                seconds,
+                priority=PRIORITY_NAMES[priority],
+                **self.labels,
+            )
+
+    def failed(self, error, backoff):
+        METRICS.count(
+            "api_errors", error=type(error).__name__, provider=self.labels["provider"]
+        )
+        with self.condition:
+            now = time.monotonic()
+            # calls sent before the pause began fail together, only the first
+            # of them extends it
+            if self.paused_until > now:
+                return
+            self.paused_until = now + retry_delay(error, self.throttles, backoff)
+            self.throttles += 1
+            # waiters already sleeping until their budget refills look again
+            self.condition.notify_all()
+        METRICS.count("rate_limit_pauses", **self.labels)
+
+    def succeeded(self):
+        if self.throttles:
+            with self.condition:
+                self.throttles = 0
+
+    def call(
+        self, function, tokens=0, priority=BACKGROUND, max_retries=5, backoff=2.0
+    ):
+        for attempt in range(max_retries + 1):
+            self.acquire(tokens, priority)
+            try:
+                result = function()
+            except Exception as error:
+                if not is_retryable(error) or attempt == max_retries:
+                    raise
+                self.failed(error, backoff)
+            else:
+                self.succeeded()
+                return result
+
+    async def call_async(
+        self, function, tokens=0, priority=BACKGROUND, max_retries=5, backoff=2.0
+    ):
+        for attempt in range(max_retries + 1):
+            await self.acquire_async(tokens, priority)
+            try:
+                result = await function()
+            except Exception as error:
+                if not is_retryable(error) or attempt == max_retries:
+                    raise
+                self.failed(error, backoff)
+            else:
+                self.succeeded()
+                return result
+
+
+class RateLimits:
+    # one ProviderLimiter per provider and model, budgets as
+    # "provider/model=requests per minute[:tokens per minute]" separated by
+    # commas, model "*" for the provider's default; no budget only paces on
+    # the server's 429s
+    def __init__(self, budgets=""):
+        self.budgets = self.parse(budgets)
+        self.lock = threading.Lock()
+        self.limiters = {}
+
+    @staticmethod
+    def parse(budgets):
+        parsed = {}
+        for entry in filter(None, (entry.strip() for entry in budgets.split(","))):
+            name, _, limits = entry.partition("=")
+            provider, _, model = name.strip().partition("/")
+            requests, _, tokens = limits.partition(":")
+            parsed[(provider, model or "*")] = (
+                float(requests) if requests.strip() else None,
+                float(tokens) if tokens.strip() else None,
+            )
+        return parsed
+
+    def limiter(self, provider, model):
+        with self.lock:
+            limiter = self.limiters.get((provider, model))
+            if limiter is None:
+                requests, tokens = self.budgets.get(
+                    (provider, model), self.budgets.get((provider, "*"), (None, None))
+                )
+                limiter = self.limiters[(provider, model)] = ProviderLimiter(
+                    provider, model, requests, tokens
+                )
+            return limiter
+
+
+# one scheduler per process, so every client of a provider shares its budget
+RATE_LIMITS = RateLimits(os.getenv("RATE_LIMITS", ""))
@@ -0,0 +1,245 @@
+import chromadb
+import fcntl
+import hashlib
+import os
+import threading
+
+from .Cache import AnswerCache, EmbeddingCache, ResponseCache
+from .Jobs import JobCoordinator
+from .LLM import AsyncGeminiLLM, AsyncGroqLLM, GeminiLLM, GroqLLM
+from .Summarizer import Summarizer
+from DataBases.ArtifactStore import ArtifactStore
+from DataBases.IndexQueue import IndexQueue, IndexWriter
+from DataBases.JobQueue import JobQueue
+from DataBases.Manifest import IngestionManifest
+from DataBases.TranscriptCache import TranscriptCache
+from DataBases.VectorStore import COLLECTION_NAME, AsyncVectorStore, VectorStore
+
+
+class ResourceRegistry:
+    def __init__(
+        self,
+        data_path="/DataBases",
+        shared_embedding_cache=True,
+        local_index=True,
+        owns_chroma=True,
+    ):
+        self.data_path = data_path
+        # one process opens the chroma db and writes what the others embed,
+        # chroma's persistent client is not safe across processes
+        self.owns_chroma = owns_chroma
+        # the memory-mapped embedding cache assumes one writing process,
+        # worker processes keep theirs in memory
+        self.shared_embedding_cache = shared_embedding_cache
+        # in-memory embedding matrices only pay off where questions are asked
+        self.local_index = local_index
+        self.lock = threading.RLock()
+        self.resources = {}
+
+    @staticmethod
+    def key_id(api_key):
+        # never keep raw api keys as dictionary keys
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+    def get_or_create(self, kind, key, factory):
+        with self.lock:
+            if (kind, key) not in self.resources:
+                self.resources[(kind, key)] = factory()
+            return self.resources[(kind, key)]
+
+    def response_cache(self):
+        return self.get_or_create(
+            "response_cache",
+            "default",
+            lambda: ResponseCache(os.path.join(self.data_path, "llm_cache.sqlite")),
+        )
+
+    def embedding_cache(self):
+        return self.get_or_create(
+            "embedding_cache",
+            "default",
+            lambda: EmbeddingCache(
+                os.path.join(self.data_path, "embedding_cache")
+                if self.shared_embedding_cache
+                else None
+            ),
+        )
+
+    def answer_cache(self):
+        return self.get_or_create(
+            "answer_cache",
+            "default",
+            lambda: AnswerCache(
+                ttl=float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600)),
+                similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95)),
+            ),
+        )
+
+    def artifact_store(self):
+        return self.get_or_create(
+            "artifact_store",
+            "default",
+            lambda: ArtifactStore(os.path.join(self.data_path, "artifacts")),
+        )
+
+    def transcript_cache(self):
+        return self.get_or_create(
+            "transcript_cache",
+            "default",
+            lambda: TranscriptCache(os.path.join(self.data_path, "transcripts")),
+        )
+
+    def manifest(self):
+        return self.get_or_create(
+            "manifest",
+            "default",
+            lambda: IngestionManifest(os.path.join(self.data_path, "manifest.sqlite")),
+        )
+
+    def job_queue(self):
+        return self.get_or_create(
+            "job_queue",
+            "default",
+            lambda: JobQueue(os.path.join(self.data_path, "jobs.sqlite")),
+        )
+
+    def job_coordinator(self):
+        return self.get_or_create("job_coordinator", "default", JobCoordinator)
+
+    def index_queue(self):
+        return self.get_or_create(
+            "index_queue",
+            "default",
+            lambda: IndexQueue(os.path.join(self.data_path, "index_queue.sqlite")),
+        )
+
+    def chroma_lock(self):
+        # held for the life of the process, a second owner fails straight away
+        path = os.path.join(self.data_path, "my_chroma_db.lock")
+
+        def lock():
+            os.makedirs(self.data_path, exist_ok=True)
+            file = open(path, "a")
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                raise RuntimeError(f"Another process owns the vector db at {path}")
+            return file
+
+        return self.get_or_create("chroma_lock", path, lock)
+
+    def chroma_client(self):
+        if not self.owns_chroma:
+            raise RuntimeError("This process writes to the vector db through a queue")
+        path = os.path.join(self.data_path, "my_chroma_db")
+        self.chroma_lock()
+        return self.get_or_create(
+            "chroma_client", path, lambda: chromadb.PersistentClient(path=path)
+        )
+
+    def index_writer(self):
+        # writes the batches worker processes embedded; its collection handle
+        # has no embedding function, it gets the embeddings with the batches
+        return self.get_or_create(
+            "index_writer",
+            "default",
+            lambda: IndexWriter(
+                self.index_queue(),
+                self.chroma_client().get_or_create_collection(
+                    COLLECTION_NAME, embedding_function=None
+                ),
+                self.vector_stores,
+            ).start(),
+        )
+
+    def gemini_llm(self, api_key):
+        return self.get_or_create(
+            "gemini_llm",
+            self.key_id(api_key),
+            lambda: GeminiLLM(api_key, self.response_cache(), self.embedding_cache()),
+        )
+
+    def groq_llm(self, api_key):
+        return self.get_or_create(
+            "groq_llm", self.key_id(api_key), lambda: GroqLLM(api_key)
+        )
+
+    def vector_store(self, api_key):
+        return self.get_or_create(
+            "vector_store",
+            self.key_id(api_key),
+            lambda: VectorStore(
+                api_key,
+                embedding_function=self.gemini_llm(api_key),
+                chroma_client=self.chroma_client() if self.owns_chroma else None,
+                local_index=self.local_index,
+                index_queue=None if self.owns_chroma else self.index_queue(),
+            ),
+        )
+
+    def vector_stores(self):
+        with self.lock:
+            return [
+                resource
+                for (kind, _), resource in self.resources.items()
+                if kind == "vector_store"
+            ]
+
+    # the async clients pool their connections on the event loop that first
+    # uses them, call them from one long-lived loop
+    def async_gemini_llm(self, api_key):
+        return self.get_or_create(
+            "async_gemini_llm",
+            self.key_id(api_key),
+            lambda: AsyncGeminiLLM(
+                api_key, self.response_cache(), self.embedding_cache()
+            ),
+        )
+
+    def async_groq_llm(self, api_key):
+        return self.get_or_create(
+            "async_groq_llm", self.key_id(api_key), lambda: AsyncGroqLLM(api_key)
+        )
+
+    def async_vector_store(self, api_key):
+        return self.get_or_create(
+            "async_vector_store",
+            self.key_id(api_key),
+            lambda: AsyncVectorStore(
+                self.vector_store(api_key), self.async_gemini_llm(api_key)
+            ),
+        )
+
+    def summarizer(self, api_key):
+        return self.get_or_create(
+            "summarizer",
+            self.key_id(api_key),
+            lambda: Summarizer(api_key, llm=self.gemini_llm(api_key)),
+        )
+
+    def stats(self):
+        with self.lock:
+            instances = {}
+            for kind, _ in self.resources:
+                instances[kind] = instances.get(kind, 0) + 1
+
+        # every Gemini/Groq client holds its own HTTP connection pool,
+        # every Chroma client its own SQLite handle and HNSW indexes
+        return {
+            "instances": instances,
+            "http_clients": sum(
+                instances.get(kind, 0)
+                for kind in [
+                    "gemini_llm",
+                    "groq_llm",
+                    "async_gemini_llm",
+                    "async_groq_llm",
+                ]
+            ),
+            "chroma_clients": instances.get("chroma_client", 0),
+            "running_jobs": self.job_coordinator().running(),
+            "queued_jobs": self.job_queue().counts(),
+            "queued_batches": self.index_queue().counts(),
+            "answer_cache": self.answer_cache().stats(),
+        }
@@ -1,15 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from .LLM import GeminiLLM
 from .HelperFunctions import chunk_by_sentences
+from .Metrics import METRICS
 
 
 class Summarizer:
-    def __init__(self, api_key):
-        self.llm = GeminiLLM(api_key)
+    def __init__(self, api_key, max_workers=4, llm=None):
+        self.llm = llm if llm is not None else GeminiLLM(api_key)
+        self.max_workers = max_workers
 
     def summarize_chunk(self, text: str):
-        self.text = text
-
-        self.system_prompt = (
+        # locals only, this runs concurrently from the map stage
+        system_prompt = (
             "You are a precise and faithful summarizer. "
             "Below is a transcript chunk from a YouTube video. "
             "Your task is to summarize the content of this chunk only. "
@@ -22,25 +24,19 @@ class Summarizer:
             "Please do not include Ads or markettings or promotions in the summary. "
             f"""Transcript Chunk: 
             ---
-            {self.text}
+            {text}
             ---
             """
         )
 
-        self.history = []
-
-        self.model = self.llm.TextLLM(
-            system_instruction=self.system_prompt,
-            history=self.history,
+        return self.llm.TextLLM(
+            system_instruction=system_prompt,
+            history=[],
             query="Provide your summary below: ",
         )
 
-        return self.model
-
     def summary_of_summaries(self, summaries):
-        self.summaries = summaries
-
-        self.system_prompt = (
+        system_prompt = (
             "You are a summarizer responsible for combining multiple independent "
             "summaries into a final coherent summary. Each summary corresponds "
             "to a chunk of a longer transcript. "
@@ -52,37 +48,64 @@ class Summarizer:
             "themes, and key information reflected across the chunk summaries."
             f"""Chunk Summaries: 
             ---
-            {self.summaries}
+            {summaries}
             ---
             """
         )
 
-        self.history = []
-
-        self.model = self.llm.TextLLM(
-            system_instruction=self.system_prompt,
-            history=self.history,
+        return self.llm.TextLLM(
+            system_instruction=system_prompt,
+            history=[],
             query="Provide the final summary below: ",
         )
 
-        return self.model
+    def parallel_map(self, function, items):
+        # executor.map keeps the results in input order
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [function(item) for item in items]
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(items))
+        ) as executor:
+            return list(executor.map(function, items))
+
+    def group_summaries(self, summaries, max_chars):
+        groups, current_group, current_len = [], [], 0
+        for summary in summaries:
+            if current_group and current_len + len(summary) > max_chars:
+                groups.append(current_group)
+                current_group, current_len = [], 0
+            current_group.append(summary)
+            current_len += len(summary)
+        if current_group:
+            groups.append(current_group)
+
+        # every summary is already too big on its own, pair them up so each level shrinks
+        if len(groups) == len(summaries):
+            groups = [summaries[i : i + 2] for i in range(0, len(summaries), 2)]
+        return groups
+
+    def reduce_summaries(self, summaries, max_chars):
+        # hierarchical reduction until the summaries fit in one prompt
+        while len(summaries) > 1 and len(" ".join(summaries)) > max_chars:
+            summaries = self.parallel_map(
+                self.summary_of_summaries, self.group_summaries(summaries, max_chars)
+            )
+
+        if len(summaries) == 1:
+            return summaries[0]
+        return self.summary_of_summaries(summaries)
 
     def summarize_transcript(self, transcript_text_list, max_chars=100_000):
-        self.max_chars = max_chars
-        self.transcript_text_list = transcript_text_list
-        self.big_text = " ".join(self.transcript_text_list)
-
-        if len(self.big_text) > self.max_chars:
-            self.chunks = chunk_by_sentences(self.big_text, self.max_chars)
-
-            self.summaries = []
-            for each_chunk in self.chunks:
-
-                self.summaries.append(self.summarize_chunk(each_chunk))
-
-            return self.summary_of_summaries(self.summaries)
-        else:
-            return self.summarize_chunk(self.big_text)
+        big_text = " ".join(transcript_text_list)
+
+        with METRICS.span("summarize"):
+            if len(big_text) > max_chars:
+                chunks = chunk_by_sentences(big_text, max_chars)
+                summaries = self.parallel_map(self.summarize_chunk, chunks)
+                return self.reduce_summaries(summaries, max_chars)
+            else:
+                return self.summarize_chunk(big_text)
 
 
 if __name__ == "__main__":
@@ -1,30 +1,176 @@
-from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api import (
+    InvalidVideoId,
+    TranscriptsDisabled,
+    VideoUnavailable,
+    YouTubeTranscriptApi,
+)
 from .AudioDownloader import AudioDownloader
-from .LLM import GroqLLM
+from .LLM import AsyncGroqLLM, GroqLLM
+from .Metrics import METRICS
+import asyncio
 import os
 
 
+class CaptionsUnavailable(Exception):
+    # reason is a short label; durable reasons won't change on a retry soon,
+    # so whisper is the only way to a transcript
+    def __init__(self, video_id, reason, durable=False):
+        super().__init__(f"No usable captions for {video_id}: {reason}")
+        self.reason = reason
+        self.durable = durable
+
+
 class Transcript:
-    def __init__(self):
-        pass
+    def __init__(self, transcript_api=None, cache=None, languages=("en",)):
+        # anything with YouTubeTranscriptApi's list, created on first use;
+        # cache is a TranscriptCache
+        self.transcript_api = transcript_api
+        self.cache = cache
+        self.languages = list(languages)
 
     def with_whisper(self, api_key, video_id, model_name="whisper-large-v3-turbo"):
-        self.video_id = video_id
-        self.model_name = model_name
+        transcript_list = []
+        for transcript_part in self.with_whisper_stream(api_key, video_id, model_name):
+            transcript_list.extend(transcript_part)
+        return transcript_list
 
-        self.audio_downloader = AudioDownloader()
-        self.audio_paths = self.audio_downloader.download_audio(self.video_id)
-        self.llm = GroqLLM(api_key)
-        self.transcript_list = self.llm.AudioLLM(self.audio_paths, self.model_name)
-        return self.transcript_list
+    def with_whisper_stream(
+        self,
+        api_key,
+        video_id,
+        model_name="whisper-large-v3-turbo",
+        audio_downloader=None,
+        llm=None,
+    ):
+        # transcribe each audio segment while the later ones are still downloading
+        audio_downloader = audio_downloader or AudioDownloader()
+        llm = llm or GroqLLM(api_key)
+        yield from llm.AudioLLMStream(
+            audio_downloader.iter_audio_segments(video_id), model_name
+        )
 
     def with_youtube_api(self, video_id):
-        self.video_id = video_id
-        self.transcript_api = YouTubeTranscriptApi()
-        self.transcript_list = self.transcript_api.fetch(
-            self.video_id, languages=["en"]
+        # no per-call state on self, one instance serves concurrent fetches;
+        # raises CaptionsUnavailable when whisper is needed
+        cached = self.cache.get(video_id) if self.cache else None
+        if cached is not None:
+            transcript_list, _, kind = cached
+            METRICS.count("cache_lookups", cache="transcript", result="hit")
+        else:
+            if self.cache:
+                METRICS.count("cache_lookups", cache="transcript", result="miss")
+                reason = self.cache.failure(video_id)
+                if reason is not None:
+                    raise CaptionsUnavailable(video_id, reason, durable=True)
+            try:
+                with METRICS.span("transcript_youtube_api"):
+                    transcript_list, language_code, kind = self.fetch_captions(
+                        video_id
+                    )
+            except CaptionsUnavailable as error:
+                METRICS.count("caption_failures", reason=error.reason)
+                if self.cache and error.durable:
+                    self.cache.set_failure(video_id, error.reason)
+                raise
+            if self.cache:
+                self.cache.set(video_id, transcript_list, language_code, kind)
+        METRICS.count("transcript_segments", len(transcript_list), source="youtube")
+        METRICS.count("caption_tracks", track=kind)
+        return transcript_list
+
+    def fetch_captions(self, video_id):
+        # one listing call, then the tracks in caption_tracks order until one
+        # fetches; returns (transcript list, language code, kind)
+        self.transcript_api = self.transcript_api or YouTubeTranscriptApi()
+        try:
+            tracks = list(self.transcript_api.list(video_id))
+        except (TranscriptsDisabled, VideoUnavailable, InvalidVideoId) as error:
+            raise CaptionsUnavailable(
+                video_id, type(error).__name__, durable=True
+            ) from error
+        except Exception as error:
+            # blocked or failed requests, worth another try later
+            raise CaptionsUnavailable(video_id, type(error).__name__) from error
+
+        last_error = None
+        for track, kind in self.caption_tracks(tracks, self.languages):
+            try:
+                transcript_list = track.fetch().to_raw_data()
+            except Exception as error:
+                last_error = error
+                continue
+            if transcript_list:
+                return transcript_list, track.language_code, kind
+
+        if last_error is not None:
+            raise CaptionsUnavailable(
+                video_id, type(last_error).__name__
+            ) from last_error
+        raise CaptionsUnavailable(video_id, "NoCaptionTracks", durable=True)
+
+    @staticmethod
+    def caption_tracks(tracks, languages):
+        # (track, kind) pairs, cheapest good transcript first: manual then
+        # generated captions in a wanted language, a translation into the
+        # first wanted language, then any track in its own language
+        def wanted_rank(track):
+            return track.is_generated, languages.index(track.language_code)
+
+        wanted = sorted(
+            (track for track in tracks if track.language_code in languages),
+            key=wanted_rank,
+        )
+        others = sorted(
+            (track for track in tracks if track.language_code not in languages),
+            key=lambda track: track.is_generated,
         )
-        return self.transcript_list
+        candidates = [
+            (track, "generated" if track.is_generated else "manual")
+            for track in wanted
+        ]
+        for track in others:
+            if track.is_translatable and any(
+                language.language_code == languages[0]
+                for language in track.translation_languages
+            ):
+                candidates.append((track.translate(languages[0]), "translated"))
+        candidates.extend((track, "original") for track in others)
+        return candidates
+
+
+class AsyncTranscript:
+    # Transcript's fetches as coroutines; youtube_transcript_api has no async
+    # client, so its requests run on the default thread pool
+    def __init__(self, transcript=None):
+        self.transcript = transcript or Transcript()
+
+    async def with_youtube_api(self, video_id):
+        return await asyncio.to_thread(self.transcript.with_youtube_api, video_id)
+
+    async def with_whisper(
+        self, api_key, video_id, model_name="whisper-large-v3-turbo"
+    ):
+        transcript_list = []
+        async for transcript_part in self.with_whisper_stream(
+            api_key, video_id, model_name
+        ):
+            transcript_list.extend(transcript_part)
+        return transcript_list
+
+    async def with_whisper_stream(
+        self,
+        api_key,
+        video_id,
+        model_name="whisper-large-v3-turbo",
+        audio_downloader=None,
+        llm=None,
+    ):
+        audio_downloader = audio_downloader or AudioDownloader()
+        llm = llm or AsyncGroqLLM(api_key)
+        async for transcript_part in llm.AudioLLMStream(
+            audio_downloader.iter_audio_segments(video_id), model_name
+        ):
+            yield transcript_part
 
 
 if __name__ == "__main__":
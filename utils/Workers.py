@@ -0,0 +1,223 @@
+import argparse
+import importlib
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# spawned workers start from a fresh interpreter, chromadb needs the same
+# newer sqlite that main.py swaps in
+if "sqlite3" not in sys.modules:
+    __import__("pysqlite3")
+    sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+
+from .Ingestion import ingest_video
+from .Metrics import METRICS
+from .Registry import ResourceRegistry
+
+
+# every pool in this process shares one cap on live worker processes, the
+# app creates a pool per pair of api keys
+MAX_WORKERS = int(os.getenv("MAX_INGEST_WORKERS", os.cpu_count() or 2))
+running = []
+running_lock = threading.Lock()
+
+
+class QueueJob:
+    # the job interface ingest_video reports to, backed by the job queue
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.job_id = job_id
+
+    def report(self, message):
+        self.job_queue.report(self.job_id, message)
+
+    def mark_ready(self):
+        self.job_queue.mark_ready(self.job_id)
+
+
+def owner_id(groq_api_key, gemini_api_key):
+    # jobs are served by workers holding the same api keys, the keys themselves
+    # are only ever passed to the worker processes in memory
+    return (
+        f"{ResourceRegistry.key_id(groq_api_key)}:"
+        f"{ResourceRegistry.key_id(gemini_api_key)}"
+    )
+
+
+def process_job(registry, job, video_id, groq_api_key, gemini_api_key):
+    result = ingest_video(job, video_id, groq_api_key, gemini_api_key, registry)
+
+    artifact_store = registry.artifact_store()
+    artifacts = artifact_store.get(video_id)
+    chunks = result["chunks"] if result else artifacts and artifacts.chunks
+    if chunks and not (artifacts and artifacts.summary):
+        # jobs of other owners waiting on the manifest wake up when the video is
+        # ready, before its summary exists; the first one summarizes and the
+        # rest find its summary once they get the lock
+        with artifact_store.video_lock(video_id):
+            artifacts = artifact_store.get(video_id)
+            if not (artifacts and artifacts.summary):
+                job.report("Summarizing...")
+                try:
+                    summary = registry.summarizer(
+                        gemini_api_key
+                    ).summarize_transcript(chunks)
+                    artifact_store.save(video_id, summary=summary)
+                except Exception as error:
+                    # the video is searchable, the app summarizes again on its own
+                    job.report(f"Summary failed: {error}")
+
+    return {"chunk_count": len(chunks) if chunks else None}
+
+
+def run_worker(
+    data_path,
+    groq_api_key,
+    gemini_api_key,
+    name,
+    stop,
+    poll_interval=1.0,
+    handler=process_job,
+    idle_timeout=60.0,
+):
+    # chunks are embedded here and written by the process owning the chroma db
+    registry = ResourceRegistry(
+        data_path, shared_embedding_cache=False, local_index=False, owns_chroma=False
+    )
+    job_queue = registry.job_queue()
+    owner = owner_id(groq_api_key, gemini_api_key)
+
+    # exits with the app, orphaned workers would keep claiming jobs, and after
+    # idle_timeout seconds without a job; the pool starts it again when needed
+    parent = os.getppid()
+    idle_since = time.monotonic()
+    while not stop.is_set() and os.getppid() == parent:
+        job_row = job_queue.claim(owner, name)
+        if job_row is None:
+            if time.monotonic() - idle_since > idle_timeout:
+                break
+            stop.wait(poll_interval)
+            continue
+
+        job = QueueJob(job_queue, job_row["id"])
+        # a worker runs one job at a time, so the metrics delta is this job's
+        before = METRICS.snapshot()
+        try:
+            result = handler(
+                registry, job, job_row["video_id"], groq_api_key, gemini_api_key
+            )
+        except Exception as error:
+            job_queue.fail(job_row["id"], error)
+        else:
+            if isinstance(result, dict):
+                result["metrics"] = METRICS.breakdown(before, METRICS.snapshot())
+            job_queue.finish(job_row["id"], result)
+        idle_since = time.monotonic()
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        groq_api_key,
+        gemini_api_key,
+        data_path="/DataBases",
+        workers=2,
+        poll_interval=1.0,
+        handler="utils.Workers:process_job",
+        idle_timeout=60.0,
+    ):
+        self.groq_api_key = groq_api_key
+        self.gemini_api_key = gemini_api_key
+        self.data_path = data_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.handler = handler
+        self.idle_timeout = idle_timeout
+        self.owner = owner_id(groq_api_key, gemini_api_key)
+
+        self.lock = threading.Lock()
+        self.processes = []
+        self.started = 0
+
+    def start(self):
+        # also replaces workers that died or went idle, so it is safe to call on
+        # every submit and while polling; past MAX_WORKERS it waits for a slot
+        with self.lock, running_lock:
+            self.processes = [
+                process for process in self.processes if process.poll() is None
+            ]
+            running[:] = [process for process in running if process.poll() is None]
+            while len(self.processes) < self.workers and len(running) < MAX_WORKERS:
+                self.started += 1
+                # a fresh interpreter rather than multiprocessing, streamlit
+                # replaces __main__ with the app script which spawn would re-run;
+                # the keys go through the environment, never to disk
+                self.processes.append(
+                    subprocess.Popen(
+                        [
+                            sys.executable,
+                            "-m",
+                            "utils.Workers",
+                            "--data-path",
+                            self.data_path,
+                            "--name",
+                            f"{os.getpid()}-worker{self.started}",
+                            "--poll-interval",
+                            str(self.poll_interval),
+                            "--handler",
+                            self.handler,
+                            "--idle-timeout",
+                            str(self.idle_timeout),
+                        ],
+                        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        env={
+                            **os.environ,
+                            "GROQ_API_KEY": self.groq_api_key,
+                            "GEMINI_API_KEY": self.gemini_api_key,
+                        },
+                    )
+                )
+                running.append(self.processes[-1])
+        return self
+
+    def stop(self, timeout=None):
+        # workers finish the job they are on before exiting
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait(timeout)
+
+    def alive(self):
+        return sum(process.poll() is None for process in self.processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion worker process")
+    parser.add_argument("--data-path", default="/DataBases")
+    parser.add_argument("--name", default=str(os.getpid()))
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--handler", default="utils.Workers:process_job")
+    parser.add_argument("--idle-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    module_name, function_name = args.handler.split(":")
+    run_worker(
+        args.data_path,
+        os.environ["GROQ_API_KEY"],
+        os.environ["GEMINI_API_KEY"],
+        args.name,
+        stop,
+        args.poll_interval,
+        getattr(importlib.import_module(module_name), function_name),
+        args.idle_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()